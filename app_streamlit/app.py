@@ -4,21 +4,28 @@ Streamlit UI for ParlaPlate - Restaurant Menu Ordering Assistant
 import os
 import sys
 import uuid
-from typing import Dict
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Dict
 from datetime import datetime
 
 import streamlit as st
-from openai import OpenAI
 from dotenv import load_dotenv
 
-# Add parent directory to path
-sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+# Fall back to the repo root on sys.path when the package isn't installed (pip install -e .)
+try:
+    import parlaplate  # noqa: F401
+except ImportError:
+    sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 from parlaplate.schemas import ChatTurn, serialize_order
-from parlaplate.personas import list_personas
-from parlaplate.agent import UnifiedWaitressAgent
-from parlaplate.utils import list_menu_jsons, load_menu_json
-from parlaplate.match import load_or_compute_embeddings
+from parlaplate.personas import Persona, list_personas
+from parlaplate.utils import list_menu_jsons, load_menu_json, peek_restaurant_name
+
+# OpenAI, the agent and the matcher (numpy, httpx) are imported lazily:
+# they aren't needed until a persona and restaurant have been chosen
+if TYPE_CHECKING:
+    from openai import OpenAI
+    from parlaplate.agent import UnifiedWaitressAgent
 
 # Load environment variables
 load_dotenv()
@@ -32,7 +39,7 @@ st.set_page_config(
 )
 
 # Custom CSS for better styling
-st.markdown("""
+_CUSTOM_CSS = """
 <style>
 .persona-card {
     border: 2px solid #f0f0f0;
@@ -58,12 +65,41 @@ st.markdown("""
     margin: 8px 0;
 }
 </style>
-""", unsafe_allow_html=True)
+"""
 
 
+# Directory the extraction CLI writes menu JSON files into
+_MENU_DIR = "opt/menu_content"
 
 
-def get_openai_config() -> Dict[str, str]:
+@st.cache_data(show_spinner=False)
+def _cached_list_menu_jsons(dir_path: str, mtime: float):
+    """List menu JSON files, keyed by directory path and mtime so new menus show up."""
+    return list_menu_jsons(dir_path)
+
+
+def _menu_dir_mtime(dir_path: str) -> float:
+    """Modification time of the menu directory, or 0.0 if it does not exist yet."""
+    try:
+        return os.path.getmtime(dir_path)
+    except OSError:
+        return 0.0
+
+
+@st.cache_data(show_spinner=False)
+def _cached_peek_name(path: str, mtime: float):
+    """Read just the restaurant name of a menu JSON, keyed by path and mtime."""
+    return peek_restaurant_name(path)
+
+
+@st.cache_resource
+def _personas():
+    """Persona registry shared across reruns and sessions."""
+    return list_personas()
+
+
+@st.cache_data
+def _openai_base_config() -> Dict[str, str]:
     """Get OpenAI configuration from secrets or environment."""
     config = {
         "api_key": None,
@@ -97,6 +133,37 @@ def get_openai_config() -> Dict[str, str]:
     return config
 
 
+def get_openai_config() -> Dict[str, str]:
+    """
+    Get OpenAI configuration, layering the sidebar-entered API key
+    over the cached secrets/environment defaults.
+    """
+    config = _openai_base_config()
+    if st.session_state.get("sidebar_api_key"):
+        config["api_key"] = st.session_state.sidebar_api_key
+    return config
+
+
+@st.cache_resource
+def _get_openai_client(api_key: str) -> "OpenAI":
+    """Shared OpenAI client per API key, so its connection pool survives reruns."""
+    from openai import OpenAI
+    return OpenAI(api_key=api_key)
+
+
+@st.cache_resource
+def _keyword_cache(model_embed: str):
+    """Keyword-extraction semantic cache shared by all sessions using an embedding model."""
+    from parlaplate.semantic_cache import SemanticCache
+    return SemanticCache()
+
+
+def _agent_cls():
+    """Import the agent class on first use."""
+    from parlaplate.agent import UnifiedWaitressAgent
+    return UnifiedWaitressAgent
+
+
 def initialize_session_state():
     """Initialize Streamlit session state."""
     if "conversation_id" not in st.session_state:
@@ -105,6 +172,7 @@ def initialize_session_state():
     if "reset_on_refresh" not in st.session_state:
         st.session_state.reset_on_refresh = True
     
+    # Stored as (role, content) tuples; ChatTurn models are built only for the agent
     if "chat_history" not in st.session_state:
         st.session_state.chat_history = []
     
@@ -125,6 +193,12 @@ def initialize_session_state():
     
     if "final_order" not in st.session_state:
         st.session_state.final_order = None
+    
+    if "final_order_json" not in st.session_state:
+        st.session_state.final_order_json = None
+    
+    if "final_order_filename" not in st.session_state:
+        st.session_state.final_order_filename = None
 
 
 def reset_conversation():
@@ -141,16 +215,14 @@ def setup_sidebar():
     st.sidebar.header("🔧 Yapılandırma")
     
     # OpenAI API Key input
-    config = get_openai_config()
-    api_key = st.sidebar.text_input(
+    config = _openai_base_config()
+    st.session_state.sidebar_api_key = st.sidebar.text_input(
         "OpenAI API Key",
-        value=config.get("api_key", ""),
+        value=config.get("api_key") or "",
         type="password",
         help="OpenAI API anahtarınızı girin"
     )
-    
-    if api_key:
-        config["api_key"] = api_key
+    config = get_openai_config()
     
     # Model configuration
     if config.get("api_key"):
@@ -173,13 +245,17 @@ def setup_sidebar():
     return config
 
 
-def show_persona_selection():
-    """Show persona selection interface."""
+@st.fragment
+def show_persona_selection(personas: Dict[str, Persona]):
+    """
+    Show persona selection interface.
+    
+    Runs as a fragment so widget interaction here only reruns the grid;
+    a selection triggers a full-app rerun to move on to restaurant selection.
+    """
     st.header("👤 Asistan Seçin")
     st.write("Size yardımcı olacak asistan tipini seçin:")
     
-    personas = list_personas()
-    
     cols = st.columns(2)
     for i, (persona_id, persona) in enumerate(personas.items()):
         col = cols[i % 2]
@@ -197,11 +273,34 @@ def show_persona_selection():
                 st.rerun()
 
 
+def _select_restaurant(restaurant_name: str, menu_data):
+    """Make a restaurant current and reset the conversation for it."""
+    st.session_state.selected_restaurant = restaurant_name
+    st.session_state.menu_data = menu_data
+    st.session_state.chat_history = []
+    st.session_state.agent = None
+    st.session_state.order_finalized = False
+    st.session_state.final_order = None
+
+
+def _on_restaurant_change(restaurant_data: Dict[str, Dict[str, str]]):
+    """Selectbox callback: apply the new restaurant before the automatic rerun."""
+    restaurant_name = st.session_state.restaurant_selector
+    menu_file = restaurant_data[restaurant_name]["file"]
+    try:
+        menu_data = load_menu_json(str(menu_file))
+    except Exception:
+        # Reported by show_restaurant_selection on the rerun
+        return
+    
+    _select_restaurant(restaurant_name, menu_data)
+
+
 def show_restaurant_selection():
     """Show restaurant selection interface."""
     st.header("🏪 Restoran Seçin")
     
-    menu_files = list_menu_jsons()
+    menu_files = _cached_list_menu_jsons(_MENU_DIR, _menu_dir_mtime(_MENU_DIR))
     
     if not menu_files:
         st.warning("Henüz menü bulunamadı. Lütfen PDF menüleri `opt/menu/` klasörüne yerleştirin ve CLI tool ile işleyin.")
@@ -213,12 +312,10 @@ def show_restaurant_selection():
     
     for menu_file in menu_files:
         try:
-            menu_json = load_menu_json(menu_file)
-            restaurant_name = menu_json.restaurant.display_name or menu_json.restaurant.name or "Unknown"
+            restaurant_name = _cached_peek_name(str(menu_file), os.path.getmtime(menu_file)) or "Unknown"
             restaurant_options.append(restaurant_name)
             restaurant_data[restaurant_name] = {
-                "file": menu_file,
-                "menu": menu_json
+                "file": menu_file
             }
         except Exception as e:
             st.error(f"Menü yüklenemedi {menu_file}: {e}")
@@ -237,22 +334,26 @@ def show_restaurant_selection():
         "Restoran seçin:",
         options=restaurant_options,
         index=current_index,
-        key="restaurant_selector"
+        key="restaurant_selector",
+        on_change=_on_restaurant_change,
+        args=(restaurant_data,)
     )
     
-    if selected_restaurant != st.session_state.selected_restaurant:
-        st.session_state.selected_restaurant = selected_restaurant
-        st.session_state.menu_data = restaurant_data[selected_restaurant]["menu"]
-        # Reset conversation when restaurant changes
-        st.session_state.chat_history = []
-        st.session_state.agent = None
-        st.session_state.order_finalized = False
-        st.session_state.final_order = None
+    # Only the selected menu is fully parsed
+    menu_file = restaurant_data[selected_restaurant]["file"]
+    try:
+        menu_data = load_menu_json(str(menu_file))
+    except Exception as e:
+        st.error(f"Menü yüklenemedi {menu_file}: {e}")
+        return None
+    
+    # Changes go through the on_change callback; only the initial default needs syncing
+    if st.session_state.selected_restaurant is None:
+        _select_restaurant(selected_restaurant, menu_data)
         st.rerun()
     
     # Show restaurant info
     if selected_restaurant:
-        menu_data = restaurant_data[selected_restaurant]["menu"]
         restaurant = menu_data.restaurant
         
         st.subheader(f"📋 {restaurant.display_name or restaurant.name}")
@@ -285,22 +386,25 @@ def show_restaurant_selection():
     return None
 
 
+_WELCOME_TEMPLATES = {
+    "ayla": "Merhaba! Ben Ayla {emoji} {rest}'a hoş geldiniz! Size sağlıklı ve dengeli seçenekler önerebilirim. Hangi tür yemekleri tercih ediyorsunuz?",
+    
+    "zeyna": "Selam! Ben Zeyna {emoji} {rest}'dayız! Bugün nasıl hissediyorsun? Ruh halina göre mükemmel lezzetler bulabilirim.",
+    
+    "mert": "Merhaba! Ben Mert {emoji} {rest}'a hoş geldin! En iyi fiyat-performans oranına sahip lezzetli seçenekleri bilirim. Bütçen ne kadar?",
+    
+    "alessandro": "Buongiorno! Ben Alessandro {emoji} {rest}'da size hizmet etmekten mutluluk duyarım. Yıllarca deneyimimle en lezzetli önerileri yapabilirim.",
+    
+    "lara": "Merhaba canım! Ben Lara {emoji} {rest}'a hoş geldin! Seni rahatlatacak ve mutlu edecek lezzetler bulalım birlikte. Ne tür yemekler seviyorsun?"
+}
+
+
 def get_welcome_message(persona, restaurant_name: str) -> str:
     """Generate persona-specific welcome message."""
-    welcome_messages = {
-        "ayla": f"Merhaba! Ben Ayla {persona.emoji} {restaurant_name}'a hoş geldiniz! Size sağlıklı ve dengeli seçenekler önerebilirim. Hangi tür yemekleri tercih ediyorsunuz?",
-        
-        "zeyna": f"Selam! Ben Zeyna {persona.emoji} {restaurant_name}'dayız! Bugün nasıl hissediyorsun? Ruh halina göre mükemmel lezzetler bulabilirim.",
-        
-        "mert": f"Merhaba! Ben Mert {persona.emoji} {restaurant_name}'a hoş geldin! En iyi fiyat-performans oranına sahip lezzetli seçenekleri bilirim. Bütçen ne kadar?",
-        
-        "alessandro": f"Buongiorno! Ben Alessandro {persona.emoji} {restaurant_name}'da size hizmet etmekten mutluluk duyarım. Yıllarca deneyimimle en lezzetli önerileri yapabilirim.",
-        
-        "lara": f"Merhaba canım! Ben Lara {persona.emoji} {restaurant_name}'a hoş geldin! Seni rahatlatacak ve mutlu edecek lezzetler bulalım birlikte. Ne tür yemekler seviyorsun?"
-    }
-    
-    persona_id = persona.name.lower()
-    return welcome_messages.get(persona_id, f"Merhaba! {restaurant_name}'a hoş geldiniz! Size nasıl yardımcı olabilirim?")
+    template = _WELCOME_TEMPLATES.get(persona.name.lower())
+    if template:
+        return template.format(emoji=persona.emoji, rest=restaurant_name)
+    return f"Merhaba! {restaurant_name}'a hoş geldiniz! Size nasıl yardımcı olabilirim?"
 
 
 def initialize_agent(config: Dict[str, str], menu_data, persona_id: str):
@@ -310,23 +414,27 @@ def initialize_agent(config: Dict[str, str], menu_data, persona_id: str):
         return None
     
     try:
-        client = OpenAI(api_key=config["api_key"])
+        from parlaplate.match import load_or_compute_embeddings
         
-        agent = UnifiedWaitressAgent(
+        client = _get_openai_client(config["api_key"])
+        
+        agent = _agent_cls()(
             client=client,
             model_chat=config["model_chat"],
             model_vision=config["model_vision"],
             model_embed=config["model_embed"],
             restaurant=menu_data.restaurant,
             menu=menu_data,
-            persona_id=persona_id
+            persona_id=persona_id,
+            keyword_cache=_keyword_cache(config["model_embed"])
         )
         
-        # Pre-compute embeddings
-        with st.spinner("Menü verileri hazırlanıyor..."):
-            load_or_compute_embeddings(
-                client, config["model_embed"], menu_data
-            )
+        # Pre-compute embeddings in the background; awaited on first message
+        if "_embed_pool" not in st.session_state:
+            st.session_state._embed_pool = ThreadPoolExecutor(max_workers=1)
+        st.session_state.embed_future = st.session_state._embed_pool.submit(
+            load_or_compute_embeddings, client, config["model_embed"], menu_data
+        )
         
         return agent
         
@@ -335,7 +443,39 @@ def initialize_agent(config: Dict[str, str], menu_data, persona_id: str):
         return None
 
 
-def show_chat_interface(agent: UnifiedWaitressAgent, config: Dict[str, str]):
+def wait_for_embeddings():
+    """Block until background embedding pre-computation (if any) has finished."""
+    embed_future = st.session_state.pop("embed_future", None)
+    if embed_future is None:
+        return
+    
+    try:
+        embed_future.result()
+    except Exception:
+        # Candidate lookup recomputes embeddings on demand
+        pass
+
+
+def _render_finalized_panel():
+    """Show the order confirmation, summary and download button."""
+    st.success("✅ Siparişiniz alındı!")
+    
+    # Show order details
+    st.subheader("📋 Sipariş Özeti")
+    for item in st.session_state.final_order.order:
+        notes_str = f" ({item.notes})" if item.notes else ""
+        st.write(f"• {item.name}{notes_str}")
+    
+    # Download button (payload and filename are frozen at finalization)
+    st.download_button(
+        "📥 Sipariş JSON İndir",
+        data=st.session_state.final_order_json,
+        file_name=st.session_state.final_order_filename,
+        mime="application/json"
+    )
+
+
+def show_chat_interface(agent: "UnifiedWaitressAgent", config: Dict[str, str]):
     """Show chat interface."""
     st.header("💬 Sohbet")
     
@@ -346,37 +486,20 @@ def show_chat_interface(agent: UnifiedWaitressAgent, config: Dict[str, str]):
             st.write(welcome_message)
     
     # Display chat history
-    for turn in st.session_state.chat_history:
-        with st.chat_message(turn.role):
-            st.write(turn.content)
+    for role, content in st.session_state.chat_history:
+        with st.chat_message(role):
+            st.write(content)
     
     # Show order finalized message if applicable
     if st.session_state.order_finalized and st.session_state.final_order:
-        st.success("✅ Siparişiniz alındı!")
-        
-        # Show order details
-        st.subheader("📋 Sipariş Özeti")
-        for item in st.session_state.final_order.order:
-            notes_str = f" ({item.notes})" if item.notes else ""
-            st.write(f"• {item.name}{notes_str}")
-        
-        # Download button
-        order_json = serialize_order(st.session_state.final_order)
-        st.download_button(
-            "📥 Sipariş JSON İndir",
-            data=order_json,
-            file_name=f"order_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json",
-            mime="application/json"
-        )
-        
+        _render_finalized_panel()
         return
     
     # Chat input (disabled if order is finalized)
     if not st.session_state.order_finalized:
         if prompt := st.chat_input("Mesajınızı yazın..."):
             # Add user message to history
-            user_turn = ChatTurn(role="user", content=prompt)
-            st.session_state.chat_history.append(user_turn)
+            st.session_state.chat_history.append(("user", prompt))
             
             # Display user message
             with st.chat_message("user"):
@@ -384,55 +507,69 @@ def show_chat_interface(agent: UnifiedWaitressAgent, config: Dict[str, str]):
             
             # Get agent response
             with st.chat_message("assistant"):
-                with st.spinner("Yanıt hazırlanıyor..."):
-                    try:
-                        # Use unified agent's respond method
-                        response, action, candidates, maybe_order = agent.respond(
-                            st.session_state.chat_history[:-1], prompt
-                        )
-                        
-                        # Add assistant response to history
-                        assistant_turn = ChatTurn(role="assistant", content=response)
-                        st.session_state.chat_history.append(assistant_turn)
-                        
-                        st.write(response)
-                        
-                        # Handle order finalization
-                        if action == "FINALIZE" and maybe_order:
-                            st.session_state.final_order = maybe_order
-                            st.session_state.order_finalized = True
-                            
-                        
-                    except Exception as e:
-                        error_msg = f"Bir hata oluştu: {e}"
-                        st.error(error_msg)
-                        
-                        assistant_turn = ChatTurn(role="assistant", content=error_msg)
-                        st.session_state.chat_history.append(assistant_turn)
+                try:
+                    with st.spinner("Yanıt hazırlanıyor..."):
+                        wait_for_embeddings()
+                    
+                    # Stream the reply into the bubble as it is generated
+                    history = [
+                        ChatTurn(role=role, content=content)
+                        for role, content in st.session_state.chat_history[:-1]
+                    ]
+                    result = []
+                    
+                    def relay_reply():
+                        result.append((yield from agent.respond_stream(history, prompt)))
+                    
+                    st.write_stream(relay_reply())
+                    response, action, candidates, maybe_order = result[0]
+                    
+                    # Add assistant response to history
+                    st.session_state.chat_history.append(("assistant", response))
+                    
+                    # Handle order finalization
+                    if action == "FINALIZE" and maybe_order:
+                        st.session_state.final_order = maybe_order
+                        st.session_state.final_order_json = serialize_order(maybe_order)
+                        st.session_state.final_order_filename = f"order_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+                        st.session_state.order_finalized = True
+                    
+                except Exception as e:
+                    error_msg = f"Bir hata oluştu: {e}"
+                    st.error(error_msg)
+                    
+                    st.session_state.chat_history.append(("assistant", error_msg))
             
-            st.rerun()
+            # The new turns are already on screen; show the order summary inline
+            if st.session_state.order_finalized and st.session_state.final_order:
+                _render_finalized_panel()
 
 
 
 
 def main():
     """Main application."""
+    # Must be emitted every run: Streamlit drops elements not re-rendered on rerun
+    st.markdown(_CUSTOM_CSS, unsafe_allow_html=True)
+    
     st.title("🍽️ ParlaPlate")
     st.subheader("AI Destekli Restoran Sipariş Asistanı")
     
     # Initialize session state
     initialize_session_state()
+    personas = _personas()
     
     # Setup sidebar and get config
     config = setup_sidebar()
     
-    # Reset conversation on refresh if enabled
-    if st.session_state.reset_on_refresh and len(st.session_state.chat_history) == 0:
+    # Reset conversation on refresh if enabled (first run of a session only)
+    if st.session_state.reset_on_refresh and not st.session_state.get("_initialized"):
         reset_conversation()
+        st.session_state._initialized = True
     
     # Step 1: Persona Selection
     if not st.session_state.selected_persona:
-        show_persona_selection()
+        show_persona_selection(personas)
         return
     
     # Step 2: Restaurant Selection
@@ -463,7 +600,6 @@ def main():
     st.sidebar.divider()
     st.sidebar.subheader("🎯 Mevcut Seçimler")
     if st.session_state.selected_persona:
-        personas = list_personas()
         persona = personas[st.session_state.selected_persona]
         st.sidebar.write(f"👤 **Asistan:** {persona.emoji} {persona.name}")
     
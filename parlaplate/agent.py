@@ -3,20 +3,228 @@ Single unified agent for ParlaPlate - handles both decision-making and conversat
 """
 import json
 import logging
-from typing import List, Dict, Any, Tuple, Optional
+import re
+from functools import lru_cache
+from typing import List, Dict, Any, Tuple, Optional, Iterator, Generator
 from datetime import datetime
 
 from openai import OpenAI
 
 from .schemas import MenuJSON, MenuItem, ChatTurn, Order, OrderItem, RestaurantProfile
 from .personas import get_persona
-from .prompts import UNIFIED_AGENT_SYSTEM, KEYWORD_EXTRACTION_SYSTEM
-from .match import rank_candidates
+from .prompts import UNIFIED_AGENT_SYSTEM, KEYWORD_EXTRACTION_SYSTEM, CANDIDATES_MESSAGE
+from .match import rank_candidates, embed_texts
+from .semantic_cache import SemanticCache
 from .utils import extract_json_from_response
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Keywords that indicate food intent
+INTENT_KEYWORDS = [
+    'acıktım', 'aç', 'yemek', 'yiyecek', 'lezzet', 'tat', 'menü',
+    'et', 'tavuk', 'balık', 'sebze', 'salata', 'çorba', 'tatlı',
+    'pizza', 'burger', 'pasta', 'döner', 'kebab', 'pilav',
+    'kahvaltı', 'öğle', 'akşam', 'atıştırmalık',
+    'vegetarian', 'vegan', 'gluten', 'spicy', 'mild', 'sweet',
+    'salty', 'crispy', 'grilled', 'fried', 'soup', 'salad'
+]
+
+# Delegation phrases
+DELEGATION_PHRASES = [
+    'sen seç', 'sana kalmış', 'öner', 'tavsiye', 'istediğin',
+    'up to you', 'you choose', 'recommend', 'suggest'
+]
+
+# Conversation turns sent to the model: the pinned opening and the recent tail
+HISTORY_HEAD_TURNS = 2
+HISTORY_TAIL_TURNS = 3
+
+# Bare greetings that are answered without a model call
+GREETING_PHRASES = [
+    'merhaba', 'merhabalar', 'selam', 'selamlar', 'günaydın', 'iyi günler',
+    'hi', 'hello', 'hey'
+]
+
+# Single-pass substring matcher over all intent keywords and delegation phrases
+_FOOD_INTENT_RE = re.compile(
+    "|".join(re.escape(term) for term in DELEGATION_PHRASES + INTENT_KEYWORDS)
+)
+
+# Whole message made of greetings and punctuation, e.g. "Merhaba!" or "selam selam"
+_GREETING_RE = re.compile(
+    r"\W*(?:(?:" + "|".join(re.escape(term) for term in GREETING_PHRASES) + r")\b\W*)+"
+)
+
+# Canned reply to a greeting-only opener
+GREETING_REPLY = "Merhaba, ben {name} {emoji} Bugün canınız ne çekiyor?"
+
+
+@lru_cache(maxsize=256)
+def _lowercase(text: str) -> str:
+    """Lowercase a history turn once; past turns never change between calls."""
+    return text.lower()
+
+
+# Leading/trailing code fences, whitespace and separators around the reply text
+_REPLY_EDGE_RE = re.compile(r'^(?:```(?:json)?|[\s,])+|(?:```|[\s}])+$')
+_REPLY_LEAD_RE = re.compile(r'^(?:```(?:json)?|[\s,])+')
+_REPLY_TRAIL_RE = re.compile(r'(?:```|[\s}])+$')
+
+# Trailing characters a streamed reply holds back, since _REPLY_TRAIL_RE may strip them
+_REPLY_TAIL_RE = re.compile(r'[\s}`]*$')
+
+# JSON remnants stripped from replies that had no well-formed action object:
+# complete action objects, incomplete fragments starting with {"action",
+# and leftover fields like ',"notes":"..."'
+_ACTION_OBJ_RE = re.compile(r'\{[^{}]*"action"[^{}]*\}')
+_ACTION_FRAG_RE = re.compile(r'\{"action"[^}]*')
+_QUOTED_FIELD_FRAG_RE = re.compile(r',"[^"]+"\s*:\s*"[^"]*"[^}]*')
+_FIELD_FRAG_RE = re.compile(r',"[^"]+"\s*:\s*[^,}]*')
+
+
+class _ActionScanner:
+    """
+    Incremental scanner that cuts the first balanced JSON object out of a
+    response, whether it arrives whole or as streamed chunks.
+    """
+    
+    def __init__(self):
+        self.text = ""
+        self.start = -1
+        self.closed = False
+        self.action: Optional[Dict[str, Any]] = None
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+    
+    def feed(self, chunk: str) -> str:
+        """
+        Scan the next chunk of the response.
+        
+        Args:
+            chunk: Next piece of the raw model response
+            
+        Returns:
+            Text following the first JSON object, or "" while it is still open
+        """
+        offset = len(self.text)
+        self.text += chunk
+        if self.closed:
+            return chunk
+        
+        for i, char in enumerate(chunk):
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == '\\':
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = self.start != -1
+            elif char == '{':
+                if self.start == -1:
+                    self.start = offset + i
+                self._depth += 1
+            elif char == '}' and self.start != -1:
+                self._depth -= 1
+                if self._depth == 0:
+                    self.closed = True
+                    try:
+                        parsed = json.loads(self.text[self.start:offset + i + 1])
+                    except json.JSONDecodeError:
+                        parsed = None
+                    if isinstance(parsed, dict):
+                        self.action = parsed
+                    return chunk[i + 1:]
+        
+        return ""
+
+
+def _split_action_and_reply(text: str) -> Optional[Tuple[Dict[str, Any], str]]:
+    """
+    Cut the first balanced JSON object out of a response in a single pass.
+    
+    Args:
+        text: Raw model response
+        
+    Returns:
+        Tuple of (action_dict, remaining_text), or None if no balanced
+        object parses to a dict
+    """
+    scanner = _ActionScanner()
+    rest = scanner.feed(text)
+    if scanner.action is None:
+        return None
+    return scanner.action, text[:scanner.start] + rest
+
+
+class _ReplyStream:
+    """
+    Filters a streamed response down to the reply text, yielding exactly what
+    parse_action_from_response stores: any prose before the action JSON plus
+    the text after it, without the code fences and separators at either edge.
+    """
+    
+    def __init__(self):
+        self.scanner = _ActionScanner()
+        self._pending = ""
+        self._tail = ""
+        self._started = False
+    
+    def feed(self, chunk: str) -> str:
+        """
+        Process the next streamed chunk.
+        
+        Args:
+            chunk: Next piece of the raw model response
+            
+        Returns:
+            Reply text ready to display (may be empty)
+        """
+        was_closed = self.scanner.closed
+        rest = self.scanner.feed(chunk)
+        if self.scanner.action is None:
+            return ""
+        if self._started:
+            return self._release(rest)
+        
+        # The stored reply keeps the text before the JSON, so it leads the stream
+        if not was_closed:
+            rest = self.scanner.text[:self.scanner.start] + rest
+        
+        # Hold leading edge characters back until the reply itself begins
+        self._pending += rest
+        lead = _REPLY_LEAD_RE.match(self._pending)
+        stripped = self._pending[lead.end():] if lead else self._pending
+        after_fence = lead is not None and lead.group().endswith('```')
+        if not stripped or '```'.startswith(stripped) or (after_fence and 'json'.startswith(stripped)):
+            return ""
+        self._started = True
+        self._pending = ""
+        return self._release(stripped)
+    
+    def finish(self) -> str:
+        """
+        Flush the text held back once the response has ended.
+        
+        Returns:
+            Remaining reply text, trimmed like the stored reply (may be empty)
+        """
+        if self.scanner.action is None:
+            return ""
+        if not self._started:
+            return _REPLY_EDGE_RE.sub('', self._pending)
+        return _REPLY_TRAIL_RE.sub('', self._tail)
+    
+    def _release(self, text: str) -> str:
+        """Return `text` minus a trailing run that may turn out to be the reply's edge."""
+        text = self._tail + text
+        cut = _REPLY_TAIL_RE.search(text).start()
+        self._tail = text[cut:]
+        return text[:cut]
+
 
 class UnifiedWaitressAgent:
     """
@@ -32,7 +240,8 @@ class UnifiedWaitressAgent:
         model_embed: str,
         restaurant: RestaurantProfile,
         menu: MenuJSON,
-        persona_id: str
+        persona_id: str,
+        keyword_cache: Optional[SemanticCache] = None
     ):
         """
         Initialize the unified waitress agent.
@@ -45,6 +254,8 @@ class UnifiedWaitressAgent:
             restaurant: Restaurant profile
             menu: Menu data
             persona_id: Selected persona ID
+            keyword_cache: Semantic cache for keyword extraction, may be shared
+                across agents; a private one is created if omitted
         """
         self.client = client
         self.model_chat = model_chat
@@ -54,19 +265,96 @@ class UnifiedWaitressAgent:
         self.menu = menu
         self.persona = get_persona(persona_id)
         self.persona_id = persona_id
+        self.keyword_cache = keyword_cache if keyword_cache is not None else SemanticCache()
+        
+        # Static system prompt and its message, formatted once for the agent's lifetime
+        self._static_system_prompt: Optional[str] = None
+        self._system_message = {"role": "system", "content": self.build_static_system_prompt()}
+        self._menu_keyword_re, self._menu_keyword_lookup = self._build_menu_keyword_matcher()
         
         logger.info(f"UnifiedWaitressAgent initialized with persona: {self.persona.name}")
     
+    def _build_menu_keyword_matcher(self) -> Tuple[Optional[re.Pattern], Dict[str, str]]:
+        """
+        Compile the menu's own item keywords into a whole-word matcher.
+        
+        Kebab-case keywords also match their space-separated form
+        ("gluten free" -> "gluten-free").
+        
+        Returns:
+            Tuple of (compiled pattern or None if the menu has no keywords,
+            mapping from matched phrase to canonical keyword)
+        """
+        lookup: Dict[str, str] = {}
+        for item in self.menu.items:
+            for keyword in item.keywords:
+                keyword = keyword.lower().strip()
+                if len(keyword) < 3:
+                    continue
+                lookup.setdefault(keyword, keyword)
+                lookup.setdefault(keyword.replace("-", " "), keyword)
+        
+        if not lookup:
+            return None, lookup
+        
+        # Longest phrases first so "smash burger" wins over "burger"
+        phrases = sorted(lookup, key=len, reverse=True)
+        pattern = re.compile(r"\b(?:" + "|".join(re.escape(p) for p in phrases) + r")\b")
+        return pattern, lookup
+    
+    def _match_menu_keywords(self, message: str, max_keywords: int = 7) -> List[str]:
+        """
+        Extract keywords locally by matching the message against menu keywords.
+        
+        Args:
+            message: User message
+            max_keywords: Maximum number of keywords to return
+            
+        Returns:
+            Matched canonical keywords in order of appearance (may be empty)
+        """
+        if self._menu_keyword_re is None:
+            return []
+        
+        keywords: List[str] = []
+        for match in self._menu_keyword_re.finditer(message.lower()):
+            keyword = self._menu_keyword_lookup[match.group(0)]
+            if keyword not in keywords:
+                keywords.append(keyword)
+                if len(keywords) >= max_keywords:
+                    break
+        
+        return keywords
+    
     def extract_user_keywords(self, message: str) -> List[str]:
         """
         Extract keywords from user message.
         
+        Menu vocabulary is matched locally first; the LLM is only used when
+        nothing on the menu is mentioned.
+        
         Args:
             message: User message
             
         Returns:
             List of extracted keywords
         """
+        keywords = self._match_menu_keywords(message)
+        if keywords:
+            logger.info(f"Local keyword match: {keywords}")
+            return keywords
+        
+        # Near-duplicate messages reuse earlier keywords instead of an LLM call
+        message_embedding = None
+        try:
+            message_embedding = embed_texts(self.client, self.model_embed, [message])[0]
+            cached_keywords = self.keyword_cache.get(message_embedding)
+            if cached_keywords is not None:
+                logger.info(f"Keyword cache hit: {cached_keywords}")
+                return list(cached_keywords)
+        except Exception as e:
+            logger.warning(f"Keyword cache lookup failed: {e}")
+        
         try:
             response = self.client.chat.completions.create(
                 model=self.model_chat,
@@ -87,7 +375,10 @@ class UnifiedWaitressAgent:
             try:
                 keywords = json.loads(json_text)
                 if isinstance(keywords, list):
-                    return [kw for kw in keywords if isinstance(kw, str)]
+                    keywords = [kw for kw in keywords if isinstance(kw, str)]
+                    if keywords and message_embedding is not None:
+                        self.keyword_cache.put(message_embedding, keywords)
+                    return keywords
             except json.JSONDecodeError as e:
                 logger.error(f"JSON decode error in keyword extraction: {e} - JSON: {json_text}")
                 return []
@@ -136,47 +427,58 @@ class UnifiedWaitressAgent:
         Returns:
             True if clear intent is detected
         """
-        # Keywords that indicate food intent
-        intent_keywords = [
-            'acıktım', 'aç', 'yemek', 'yiyecek', 'lezzet', 'tat', 'menü',
-            'et', 'tavuk', 'balık', 'sebze', 'salata', 'çorba', 'tatlı',
-            'pizza', 'burger', 'pasta', 'döner', 'kebab', 'pilav',
-            'kahvaltı', 'öğle', 'akşam', 'atıştırmalık',
-            'vegetarian', 'vegan', 'gluten', 'spicy', 'mild', 'sweet',
-            'salty', 'crispy', 'grilled', 'fried', 'soup', 'salad'
-        ]
-        
-        # Delegation phrases
-        delegation_phrases = [
-            'sen seç', 'sana kalmış', 'öner', 'tavsiye', 'istediğin',
-            'up to you', 'you choose', 'recommend', 'suggest'
-        ]
-        
         # Check current message and recent history
         all_text = user_message.lower()
         for turn in history[-3:]:  # Last 3 turns
-            all_text += " " + turn.content.lower()
+            all_text += " " + _lowercase(turn.content)
         
-        # Check for delegation first
-        if any(phrase in all_text for phrase in delegation_phrases):
-            return True
+        # Delegation or food intent, matched in one scan
+        return _FOOD_INTENT_RE.search(all_text) is not None
+    
+    @staticmethod
+    def history_window(history: List[ChatTurn]) -> List[ChatTurn]:
+        """
+        Select the history turns sent to the model.
         
-        # Check for food intent keywords
-        if any(keyword in all_text for keyword in intent_keywords):
-            return True
+        The opening turns stay pinned and only the tail slides, so consecutive
+        requests share a byte-identical message prefix that the provider's
+        prompt cache can reuse.
         
-        return False
+        Args:
+            history: Conversation history
+            
+        Returns:
+            At most HISTORY_HEAD_TURNS + HISTORY_TAIL_TURNS turns
+        """
+        if len(history) <= HISTORY_HEAD_TURNS + HISTORY_TAIL_TURNS:
+            return history
+        return history[:HISTORY_HEAD_TURNS] + history[-HISTORY_TAIL_TURNS:]
     
-    def build_system_prompt(self, candidates: Optional[List[MenuItem]] = None) -> str:
+    def is_greeting(self, user_message: str) -> bool:
         """
-        Build the system prompt for the unified agent.
+        Check if a message is only a short greeting.
         
         Args:
-            candidates: Optional menu candidates for grounding
+            user_message: Current user message
             
+        Returns:
+            True if the message needs no model call to answer
+        """
+        return len(user_message) < 20 and _GREETING_RE.fullmatch(user_message.lower()) is not None
+    
+    def build_static_system_prompt(self) -> str:
+        """
+        Build the system prompt for the unified agent.
+        
+        Depends only on the restaurant and persona, so it is built once and kept
+        byte-identical across calls to benefit from provider-side prefix caching.
+        
         Returns:
             Complete system prompt
         """
+        if self._static_system_prompt is not None:
+            return self._static_system_prompt
+        
         # Restaurant context
         cuisine_str = ", ".join(self.restaurant.cuisine_tags) if self.restaurant.cuisine_tags else "diverse"
         service_str = ", ".join(self.restaurant.service_style) if self.restaurant.service_style else "casual"
@@ -184,31 +486,39 @@ class UnifiedWaitressAgent:
         # Persona context
         persona_context = self.persona.system_prompt
         
-        # Candidates JSON (if provided)
-        candidates_json = ""
-        if candidates:
-            candidate_data = []
-            for item in candidates[:3]:  # Top 3 only
-                candidate_data.append({
-                    "name": item.name,
-                    "price": item.price,
-                    "keywords": item.keywords[:5],
-                    "allergens": item.allergens,
-                    "ingredients": item.ingredients[:3]  # First 3 ingredients
-                })
-            candidates_json = json.dumps(candidate_data, ensure_ascii=False, indent=2)
-        
         # Build full system prompt
-        system_prompt = UNIFIED_AGENT_SYSTEM.format(
+        self._static_system_prompt = UNIFIED_AGENT_SYSTEM.format(
             service_style=service_str,
             cuisine_tags=cuisine_str,
             price_level=self.restaurant.price_level or "varies",
             summary_text=self.restaurant.summary_text,
-            persona_context=persona_context,
-            candidates_json=candidates_json
+            persona_context=persona_context
         )
         
-        return system_prompt
+        return self._static_system_prompt
+    
+    def build_candidates_message(self, candidates: List[MenuItem]) -> Dict[str, str]:
+        """
+        Build the trailing message that grounds a reply in menu candidates.
+        
+        Args:
+            candidates: Menu candidates for grounding
+            
+        Returns:
+            Chat message dict
+        """
+        candidate_data = []
+        for item in candidates[:3]:  # Top 3 only
+            candidate_data.append({
+                "name": item.name,
+                "price": item.price,
+                "keywords": item.keywords[:5],
+                "allergens": item.allergens,
+                "ingredients": item.ingredients[:3]  # First 3 ingredients
+            })
+        candidates_json = json.dumps(candidate_data, ensure_ascii=False, indent=2)
+        
+        return {"role": "system", "content": CANDIDATES_MESSAGE.format(candidates_json=candidates_json)}
     
     def parse_action_from_response(self, response_text: str) -> Tuple[Dict[str, Any], str]:
         """
@@ -220,13 +530,38 @@ class UnifiedWaitressAgent:
         Returns:
             Tuple of (action_dict, reply_text)
         """
-        # Extract first JSON object (action)
-        action_json = extract_json_from_response(response_text)
-        action_dict = {"action": "ASK", "intent_clear": False, "notes": "fallback"}
-        
         # Debug: log the raw response to understand what's happening
         logger.info(f"Raw API response: {response_text[:200]}...")
         
+        split = _split_action_and_reply(response_text)
+        if split is not None:
+            action_dict, reply_text = split
+        else:
+            action_dict, reply_text = self._parse_action_fallback(response_text)
+        
+        # Clean up code fences, separators and stray braces around the reply
+        reply_text = _REPLY_EDGE_RE.sub('', reply_text)
+        
+        # If reply is empty or just whitespace, use a fallback
+        if not reply_text.strip():
+            reply_text = "Nasıl yardımcı olabilirim?"
+        
+        return action_dict, reply_text
+    
+    def _parse_action_fallback(self, response_text: str) -> Tuple[Dict[str, Any], str]:
+        """
+        Parse responses without a well-formed leading action object
+        (bare arrays, truncated JSON fragments).
+        
+        Args:
+            response_text: Raw model response
+            
+        Returns:
+            Tuple of (action_dict, reply_text) with the reply not yet trimmed
+        """
+        action_json = extract_json_from_response(response_text)
+        action_dict = {"action": "ASK", "intent_clear": False, "notes": "fallback"}
+        
         if action_json:
             try:
                 parsed_json = json.loads(action_json)
@@ -262,41 +597,10 @@ class UnifiedWaitressAgent:
         reply_text = response_text
         
         # Use regex to remove any JSON-like structures completely
-        import re
-        # Remove complete JSON objects (including incomplete ones)
-        reply_text = re.sub(r'\{[^{}]*"action"[^{}]*\}', '', reply_text)
-        # Remove incomplete JSON fragments that start with {"action"
-        reply_text = re.sub(r'\{"action"[^}]*', '', reply_text)
-        # Remove any leftover JSON fragments like ',"notes":"..."'
-        reply_text = re.sub(r',"[^"]+"\s*:\s*"[^"]*"[^}]*', '', reply_text)
-        reply_text = re.sub(r',"[^"]+"\s*:\s*[^,}]*', '', reply_text)
-        
-        # Clean up common prefixes and suffixes
-        reply_text = reply_text.strip()
-        while reply_text.startswith(('```', '\n', ' ', '\t', ',')):
-            if reply_text.startswith('```'):
-                reply_text = reply_text[3:].strip()
-            elif reply_text.startswith('\n'):
-                reply_text = reply_text[1:].strip()
-            elif reply_text.startswith(','):
-                reply_text = reply_text[1:].strip()
-            else:
-                reply_text = reply_text.lstrip()
-        
-        while reply_text.endswith(('```', '\n', ' ', '\t', '}')):
-            if reply_text.endswith('```'):
-                reply_text = reply_text[:-3].strip()
-            elif reply_text.endswith('\n'):
-                reply_text = reply_text[:-1].strip()
-            elif reply_text.endswith('}'):
-                reply_text = reply_text[:-1].strip()
-            else:
-                reply_text = reply_text.rstrip()
-        
-        # If reply is empty or just whitespace, use a fallback
-        if not reply_text.strip():
-            reply_text = "Nasıl yardımcı olabilirim?"
-        
+        reply_text = _ACTION_OBJ_RE.sub('', reply_text)
+        reply_text = _ACTION_FRAG_RE.sub('', reply_text)
+        reply_text = _QUOTED_FIELD_FRAG_RE.sub('', reply_text)
+        reply_text = _FIELD_FRAG_RE.sub('', reply_text)
         
         return action_dict, reply_text
     
@@ -326,6 +630,34 @@ class UnifiedWaitressAgent:
         logger.info(f"Finalized order with {len(order_items)} items")
         return order
     
+    def _stream_chat(self, messages: List[Dict[str, str]]) -> Iterator[str]:
+        """
+        Stream a chat completion as content deltas.
+        
+        Args:
+            messages: Chat messages to send
+            
+        Yields:
+            Content deltas as they arrive
+        """
+        stream = self.client.chat.completions.create(
+            model=self.model_chat,
+            messages=messages,
+            stream=True
+        )
+        
+        for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+    
+    @staticmethod
+    def _shows_first_reply(action_dict: Dict[str, Any], intent_clear: bool) -> bool:
+        """Whether the first call's reply is final and can be streamed live."""
+        action = action_dict.get("action", "ASK")
+        if action == "FINALIZE":
+            return False
+        return not (action in ["LOOKUP", "RECOMMEND", "REFINE"] and intent_clear)
+    
     def respond(
         self, 
         history: List[ChatTurn], 
@@ -338,6 +670,35 @@ class UnifiedWaitressAgent:
             history: Conversation history
             user_message: Current user message
             
+        Returns:
+            Tuple of (reply_text, action, candidates, maybe_order)
+        """
+        stream = self.respond_stream(history, user_message)
+        while True:
+            try:
+                next(stream)
+            except StopIteration as stop:
+                return stop.value
+    
+    def respond_stream(
+        self, 
+        history: List[ChatTurn], 
+        user_message: str
+    ) -> Generator[str, None, Tuple[str, str, List[MenuItem], Optional[Order]]]:
+        """
+        Streaming variant of respond() that yields the reply as it is generated.
+        
+        The action JSON leads each response, so reply tokens are yielded as soon
+        as it closes. A reply that the grounded second call will replace is
+        never shown; the second call is streamed instead.
+        
+        Args:
+            history: Conversation history
+            user_message: Current user message
+            
+        Yields:
+            Pieces of the reply text to display
+            
         Returns:
             Tuple of (reply_text, action, candidates, maybe_order)
         """
@@ -345,25 +706,39 @@ class UnifiedWaitressAgent:
             # Check if user has expressed clear food intent
             intent_clear = self.check_food_intent(history, user_message)
             
-            # Build conversation context
-            context_parts = []
-            for turn in history[-5:]:  # Last 5 turns for context
-                context_parts.append(f"{turn.role}: {turn.content}")
-            context_parts.append(f"user: {user_message}")
-            conversation_context = "\n".join(context_parts)
+            # A bare greeting gets the persona's canned opener, saving a round-trip
+            if not intent_clear and self.is_greeting(user_message):
+                reply_text = GREETING_REPLY.format(name=self.persona.name, emoji=self.persona.emoji)
+                yield reply_text
+                return reply_text, "ASK", [], None
+            
+            # Build conversation as role messages after the static system prefix
+            conversation_messages = [
+                {"role": turn.role, "content": turn.content}
+                for turn in self.history_window(history)
+            ]
+            conversation_messages.append({"role": "user", "content": user_message})
+            
+            # Menu vocabulary is matched locally up front (no API cost); the LLM and
+            # embedding fallback only runs once the decision calls for a lookup
+            local_keywords = self._match_menu_keywords(user_message) if intent_clear else []
             
             # First call: get initial decision and reply
-            system_prompt = self.build_system_prompt()
+            system_message = self._system_message
             
-            response = self.client.chat.completions.create(
-                model=self.model_chat,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": conversation_context}
-                ]
-            )
+            reply_stream = _ReplyStream()
+            shown = False
+            for delta in self._stream_chat([system_message, *conversation_messages]):
+                piece = reply_stream.feed(delta)
+                if piece and self._shows_first_reply(reply_stream.scanner.action, intent_clear):
+                    shown = True
+                    yield piece
+            piece = reply_stream.finish()
+            if piece and self._shows_first_reply(reply_stream.scanner.action, intent_clear):
+                shown = True
+                yield piece
             
-            response_text = response.choices[0].message.content.strip()
+            response_text = reply_stream.scanner.text.strip()
             action_dict, reply_text = self.parse_action_from_response(response_text)
             
             # Ensure action_dict is a dictionary
@@ -380,7 +755,7 @@ class UnifiedWaitressAgent:
             # If action requires menu access and intent is clear
             if action in ["LOOKUP", "RECOMMEND", "REFINE"] and intent_clear:
                 # Extract keywords and get candidates
-                keywords = self.extract_user_keywords(user_message)
+                keywords = local_keywords or self.extract_user_keywords(user_message)
                 constraints = {
                     "diet": [],
                     "avoid_allergens": [],
@@ -391,17 +766,22 @@ class UnifiedWaitressAgent:
                 
                 # Second call: generate grounded response with candidates
                 if candidates:
-                    system_prompt_with_candidates = self.build_system_prompt(candidates)
+                    reply_stream = _ReplyStream()
+                    for delta in self._stream_chat([
+                        system_message,
+                        *conversation_messages,
+                        self.build_candidates_message(candidates)
+                    ]):
+                        piece = reply_stream.feed(delta)
+                        if piece:
+                            shown = True
+                            yield piece
+                    piece = reply_stream.finish()
+                    if piece:
+                        shown = True
+                        yield piece
                     
-                    response = self.client.chat.completions.create(
-                        model=self.model_chat,
-                        messages=[
-                            {"role": "system", "content": system_prompt_with_candidates},
-                            {"role": "user", "content": f"{conversation_context}\n\nProvide specific recommendations from the menu candidates."}
-                        ]
-                    )
-                    
-                    response_text = response.choices[0].message.content.strip()
+                    response_text = reply_stream.scanner.text.strip()
                     _, reply_text = self.parse_action_from_response(response_text)
             
             # Handle finalization
@@ -413,8 +793,14 @@ class UnifiedWaitressAgent:
                 
                 reply_text = "✅ Harika! Siparişiniz hazırlanıyor. Aşağıdan sipariş detaylarınızı indirebilirsiniz."
             
+            # Nothing was streamed live (no parsable action JSON, or a fixed reply)
+            if not shown:
+                yield reply_text
+            
             return reply_text, action, candidates, maybe_order
             
         except Exception as e:
             logger.error(f"Unified agent error: {e}", exc_info=True)
-            return "Özür dilerim, bir sorun oluştu. Lütfen tekrar deneyin.", "ASK", [], None
\ No newline at end of file
+            reply_text = "Özür dilerim, bir sorun oluştu. Lütfen tekrar deneyin."
+            yield reply_text
+            return reply_text, "ASK", [], None
\ No newline at end of file
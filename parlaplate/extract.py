@@ -4,58 +4,150 @@ PDF menu extraction using GPT Vision API.
 import os
 import json
 import logging
-import io
-from typing import Tuple, List, Dict, Any
+import re
+from concurrent.futures import ThreadPoolExecutor
+from typing import Tuple, List, Dict, Any, Optional
 from pathlib import Path
 
 import fitz  # PyMuPDF
-from PIL import Image
+import numpy as np
 from openai import OpenAI
 
+from .rate_limit import RateLimiter
 from .schemas import MenuJSON, MenuItem, RestaurantProfile
-from .utils import pil_to_base64_png, clean_filename, extract_json_from_response, merge_menu_items, save_menu_json
+from .utils import bytes_to_data_url, clean_filename, extract_json_from_response, merge_menu_items, save_menu_json
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# First number in a price string
+_PRICE_RE = re.compile(r'(\d+)')
 
-def render_pdf_page_to_pil(pdf_page: fitz.Page, dpi: int = 200) -> Image.Image:
+
+def render_pdf_page_to_jpeg(
+    pdf_page: fitz.Page,
+    dpi: int = 200,
+    max_dimension: int = 1024,
+    jpg_quality: int = 85
+) -> bytes:
     """
-    Render a PDF page to PIL Image.
+    Render a PDF page straight to JPEG bytes.
+    
+    The DPI is capped so the longest side comes out at most `max_dimension`
+    pixels, so no separate resize or PIL round-trip is needed.
     
     Args:
         pdf_page: PyMuPDF page object
-        dpi: Rendering DPI
+        dpi: Maximum rendering DPI
+        max_dimension: Maximum width/height of the rendered image in pixels
+        jpg_quality: JPEG quality (0-100)
         
     Returns:
-        PIL Image of the page
+        JPEG-encoded image bytes
     """
-    # Render page to pixmap
-    mat = fitz.Matrix(dpi / 72, dpi / 72)  # Scale factor for DPI
-    pix = pdf_page.get_pixmap(matrix=mat)
-    
-    # Convert to PIL Image
-    img_data = pix.tobytes("png")
-    img = Image.open(io.BytesIO(img_data))
-    
-    # Optionally resize if too large
-    max_dimension = 1024
-    if max(img.width, img.height) > max_dimension:
-        ratio = max_dimension / max(img.width, img.height)
-        new_size = (int(img.width * ratio), int(img.height * ratio))
-        img = img.resize(new_size, Image.Resampling.LANCZOS)
-    
-    return img
+    page_rect = pdf_page.rect
+    target_dpi = min(dpi, 72 * max_dimension / max(page_rect.width, page_rect.height))
+    
+    mat = fitz.Matrix(target_dpi / 72, target_dpi / 72)  # Scale factor for DPI
+    pix = pdf_page.get_pixmap(matrix=mat, alpha=False)
+    
+    return pix.tobytes("jpeg", jpg_quality=jpg_quality)
+
+
+def compute_page_hash(pdf_page: fitz.Page, hash_size: int = 16) -> int:
+    """
+    Compute a perceptual difference hash (dHash) of a PDF page.
+    
+    The page is rendered as a small grayscale pixmap and averaged down to a
+    `hash_size` x (`hash_size` + 1) grid; each bit records whether a cell is
+    brighter than its right neighbour. Small differences such as page numbers
+    barely move the hash, so near-duplicate pages differ by only a few bits.
+    
+    Args:
+        pdf_page: PyMuPDF page object
+        hash_size: Grid height; the hash has hash_size**2 bits
+        
+    Returns:
+        Hash as an integer
+    """
+    rows, cols = hash_size, hash_size + 1
+    page_rect = pdf_page.rect
+    mat = fitz.Matrix(cols * 4 / page_rect.width, rows * 4 / page_rect.height)
+    pix = pdf_page.get_pixmap(matrix=mat, colorspace=fitz.csGRAY, alpha=False)
+    
+    pixels = np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.width)
+    row_edges = np.linspace(0, pix.height, rows + 1).astype(int)
+    col_edges = np.linspace(0, pix.width, cols + 1).astype(int)
+    
+    # Mean brightness of each grid cell
+    sums = np.add.reduceat(
+        np.add.reduceat(pixels.astype(np.float32), row_edges[:-1], axis=0),
+        col_edges[:-1], axis=1
+    )
+    cells = sums / np.outer(np.diff(row_edges), np.diff(col_edges))
+    
+    bits = cells[:, 1:] > cells[:, :-1]
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+def is_blank_page(pdf_page: fitz.Page, max_std: float = 2.0, thumbnail_size: int = 256) -> bool:
+    """
+    Check if a PDF page is (nearly) uniform, e.g. an empty or page-number-only page.
+    
+    A page with any text layer is never blank. For scanned pages the threshold
+    is deliberately low, so only pages with next to nothing on them are skipped.
+    
+    Args:
+        pdf_page: PyMuPDF page object
+        max_std: Maximum grayscale standard deviation of a blank page
+        thumbnail_size: Longest side of the grayscale thumbnail in pixels
+        
+    Returns:
+        True if the page can be skipped
+    """
+    # A single short item can render with almost no variance, so trust the text layer
+    if pdf_page.get_text().strip():
+        return False
+    
+    page_rect = pdf_page.rect
+    zoom = thumbnail_size / max(page_rect.width, page_rect.height)
+    pix = pdf_page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), colorspace=fitz.csGRAY, alpha=False)
+    
+    pixels = np.frombuffer(pix.samples, dtype=np.uint8)
+    return float(pixels.std()) <= max_std
+
+
+def find_similar_page(
+    page_hash: int,
+    unique_pages: List[Tuple[int, int]],
+    max_distance: int = 4
+) -> Optional[int]:
+    """
+    Find the first earlier page whose perceptual hash is close to `page_hash`.
+    
+    Args:
+        page_hash: Perceptual hash of the page being checked
+        unique_pages: (page index, hash) pairs of earlier distinct pages, in page order
+        max_distance: Maximum Hamming distance for two pages to count as duplicates
+        
+    Returns:
+        Index of the matching page, or None if the page is new
+    """
+    for first_index, first_hash in unique_pages:
+        if bin(page_hash ^ first_hash).count("1") <= max_distance:
+            return first_index
+    return None
 
 
 def extract_items_from_page(
     client: OpenAI,
     model_vision: str,
-    page_image: Image.Image,
+    page_image: bytes,
     extraction_system: str,
     extraction_user: str,
-    page_num: int
+    page_num: int,
+    rate_limiter: Optional[RateLimiter] = None
 ) -> List[Dict[str, Any]]:
     """
     Extract menu items from a single page image using Vision API.
@@ -63,19 +155,22 @@ def extract_items_from_page(
     Args:
         client: OpenAI client
         model_vision: Vision model name
-        page_image: PIL Image of the page
+        page_image: JPEG-encoded image of the page
         extraction_system: System prompt for extraction
         extraction_user: User prompt for extraction
         page_num: Page number (for logging)
+        rate_limiter: Shared limiter to wait on before the API call (None disables)
         
     Returns:
         List of menu item dictionaries
     """
     try:
         # Convert image to base64
-        image_data_url = pil_to_base64_png(page_image)
+        image_data_url = bytes_to_data_url(page_image, "image/jpeg")
         
         # Make API call
+        if rate_limiter is not None:
+            rate_limiter.acquire()
         response = client.chat.completions.create(
             model=model_vision,
             messages=[
@@ -129,7 +224,8 @@ def create_restaurant_profile(
     model_chat: str,
     merged_items: List[Dict[str, Any]],
     summary_system: str,
-    pdf_name: str
+    pdf_name: str,
+    rate_limiter: Optional[RateLimiter] = None
 ) -> RestaurantProfile:
     """
     Create restaurant profile from merged menu items.
@@ -140,6 +236,7 @@ def create_restaurant_profile(
         merged_items: List of all menu items
         summary_system: System prompt for profiling
         pdf_name: Original PDF name
+        rate_limiter: Shared limiter to wait on before the API call (None disables)
         
     Returns:
         RestaurantProfile object
@@ -148,6 +245,8 @@ def create_restaurant_profile(
         # Prepare items for analysis
         items_json = json.dumps(merged_items, ensure_ascii=False, indent=2)
         
+        if rate_limiter is not None:
+            rate_limiter.acquire()
         response = client.chat.completions.create(
             model=model_chat,
             messages=[
@@ -188,15 +287,11 @@ def create_restaurant_profile(
             price_range = "varies"
             
             # Analyze price range if available
-            prices = []
-            for item in merged_items:
-                price_str = item.get('price', '')
-                if price_str and '₺' in price_str:
-                    # Extract first number from price string
-                    import re
-                    numbers = re.findall(r'\d+', price_str)
-                    if numbers:
-                        prices.append(int(numbers[0]))
+            prices = [
+                int(match.group(1))
+                for price_str in (item.get('price') for item in merged_items)
+                if price_str and '₺' in price_str and (match := _PRICE_RE.search(price_str))
+            ]
             
             if prices:
                 avg_price = sum(prices) / len(prices)
@@ -234,7 +329,12 @@ def extract_menu_from_pdf_bytes(
     model_chat: str,
     extraction_system: str,
     extraction_user: str,
-    summary_system: str
+    summary_system: str,
+    max_workers: int = 8,
+    dedup_distance: Optional[int] = None,
+    blank_max_std: Optional[float] = 2.0,
+    rate_limiter: Optional[RateLimiter] = None,
+    output_dir: str = "opt/menu_content"
 ) -> Tuple[MenuJSON, str]:
     """
     Extract menu from PDF bytes.
@@ -248,6 +348,16 @@ def extract_menu_from_pdf_bytes(
         extraction_system: System prompt for extraction
         extraction_user: User prompt for extraction
         summary_system: System prompt for restaurant profiling
+        max_workers: Maximum number of concurrent page extraction calls
+        dedup_distance: Maximum perceptual-hash distance at which a page reuses an
+            earlier page's extraction instead of a new Vision call (None, the
+            default, disables; pages sharing a layout can hash alike even when
+            their items differ, so only enable it for scans with repeated pages)
+        blank_max_std: Grayscale standard deviation at or below which a page is
+            treated as blank and skipped (None disables)
+        rate_limiter: Limiter shared by every API call, e.g. across concurrently
+            processed PDFs (None disables)
+        output_dir: Directory the menu JSON is saved to
         
     Returns:
         Tuple of (MenuJSON object, output file path)
@@ -257,33 +367,51 @@ def extract_menu_from_pdf_bytes(
     # Open PDF
     pdf_doc = fitz.open(stream=pdf_bytes, filetype="pdf")
     
-    all_page_items = []
-    empty_pages = 0
+    # Submit each page's Vision call as soon as it is rendered, so rasterizing the
+    # remaining pages overlaps with the requests already in flight
+    page_count = len(pdf_doc)
+    futures = {}
+    duplicates = {}
+    unique_pages: List[Tuple[int, int]] = []
     
-    # Process each page
-    for page_num in range(len(pdf_doc)):
-        logger.info(f"Processing page {page_num + 1}/{len(pdf_doc)}")
-        
-        page = pdf_doc[page_num]
-        
-        # Render page to image
-        page_image = render_pdf_page_to_pil(page)
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, page_count))) as executor:
+        for page_num, page in enumerate(pdf_doc):
+            # Blank pages contribute nothing, so they get neither a render nor a Vision call
+            if blank_max_std is not None and is_blank_page(page, blank_max_std):
+                logger.info(f"Page {page_num + 1}/{page_count} is blank, skipping")
+                continue
+            
+            # Near-identical pages (repeated headers, layouts differing only by page
+            # number) reuse the first page's extraction
+            if dedup_distance is not None:
+                page_hash = compute_page_hash(page)
+                first_page_num = find_similar_page(page_hash, unique_pages, dedup_distance)
+                if first_page_num is not None:
+                    logger.info(f"Page {page_num + 1} duplicates page {first_page_num + 1}, skipping Vision call")
+                    duplicates[page_num] = first_page_num
+                    continue
+                unique_pages.append((page_num, page_hash))
+            
+            logger.info(f"Rendering page {page_num + 1}/{page_count}")
+            futures[page_num] = executor.submit(
+                extract_items_from_page,
+                client, model_vision, render_pdf_page_to_jpeg(page),
+                extraction_system, extraction_user, page_num + 1, rate_limiter
+            )
         
-        # Extract items from page
-        page_items = extract_items_from_page(
-            client, model_vision, page_image, 
-            extraction_system, extraction_user, page_num + 1
-        )
+        # Close PDF document
+        pdf_doc.close()
         
-        if not page_items:
-            empty_pages += 1
-        else:
-            all_page_items.append(page_items)
+        # Collect in page order; blank pages have no future and yield no items
+        results = []
+        for page_num in range(page_count):
+            future = futures.get(duplicates.get(page_num, page_num))
+            results.append(future.result() if future is not None else [])
     
-    logger.info(f"Processed {len(pdf_doc)} pages, {empty_pages} empty pages")
-
-    # Close PDF document
-    pdf_doc.close()
+    all_page_items = [page_items for page_items in results if page_items]
+    empty_pages = page_count - len(all_page_items)
+    
+    logger.info(f"Processed {page_count} pages, {empty_pages} empty pages")
     
     # Merge items from all pages
     merged_items = merge_menu_items(all_page_items)
@@ -301,7 +429,7 @@ def extract_menu_from_pdf_bytes(
     
     # Create restaurant profile
     restaurant_profile = create_restaurant_profile(
-        client, model_chat, merged_items, summary_system, pdf_name
+        client, model_chat, merged_items, summary_system, pdf_name, rate_limiter
     )
     
     # Create MenuJSON
@@ -312,7 +440,7 @@ def extract_menu_from_pdf_bytes(
     
     # Save to output directory
     clean_name = clean_filename(pdf_name)
-    output_path = f"opt/menu_content/{clean_name}.json"
+    output_path = os.path.join(output_dir, f"{clean_name}.json")
     save_menu_json(menu_json, output_path)
     
     logger.info(f"Saved menu to: {output_path}")
@@ -327,7 +455,12 @@ def extract_menu_from_pdf_path(
     model_chat: str,
     extraction_system: str,
     extraction_user: str,
-    summary_system: str
+    summary_system: str,
+    max_workers: int = 8,
+    dedup_distance: Optional[int] = None,
+    blank_max_std: Optional[float] = 2.0,
+    rate_limiter: Optional[RateLimiter] = None,
+    output_dir: str = "opt/menu_content"
 ) -> Tuple[MenuJSON, str]:
     """
     Extract menu from PDF file path.
@@ -340,6 +473,13 @@ def extract_menu_from_pdf_path(
         extraction_system: System prompt for extraction
         extraction_user: User prompt for extraction
         summary_system: System prompt for restaurant profiling
+        max_workers: Maximum number of concurrent page extraction calls
+        dedup_distance: Maximum perceptual-hash distance for reusing an earlier
+            page's extraction (None, the default, disables)
+        blank_max_std: Grayscale standard deviation at or below which a page is
+            treated as blank (None disables)
+        rate_limiter: Limiter shared by every API call (None disables)
+        output_dir: Directory the menu JSON is saved to
         
     Returns:
         Tuple of (MenuJSON object, output file path)
@@ -351,5 +491,6 @@ def extract_menu_from_pdf_path(
     
     return extract_menu_from_pdf_bytes(
         pdf_bytes, pdf_name, client, model_vision, model_chat,
-        extraction_system, extraction_user, summary_system
+        extraction_system, extraction_user, summary_system, max_workers,
+        dedup_distance, blank_max_std, rate_limiter, output_dir
     )
\ No newline at end of file
@@ -2,27 +2,74 @@
 Embedding utilities and candidate matching for menu items.
 """
 import os
+import re
 import hashlib
-from typing import List, Dict, Any
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import List, Dict, Any, FrozenSet, Optional, Tuple
 import json
 
 import numpy as np
 from openai import OpenAI
 
+try:
+    import hnswlib
+except ImportError:  # Optional: exact cosine ranking is used without it
+    hnswlib = None
+
 from .schemas import MenuItem, MenuJSON
 from .utils import price_bucket
 
+# In-process cache of loaded/computed embeddings: (model, cache path) -> matrix
+_EMBEDDING_MEMO: Dict[Tuple[str, str], np.ndarray] = {}
+
+# Recent query embeddings: (model, query text) -> vector, least recently used evicted first
+QUERY_EMBEDDING_CACHE_SIZE = 512
+_QUERY_EMBEDDINGS: "OrderedDict[Tuple[str, str], np.ndarray]" = OrderedDict()
+_QUERY_EMBEDDINGS_LOCK = threading.Lock()
+
+# Menus smaller than this are ranked exactly; brute force wins at small sizes
+ANN_MIN_ITEMS = 500
+_ANN_INDEXES: Dict[Tuple[str, str], Any] = {}
+
+# Score multiplier for expensive items when the user prefers low prices
+LOW_PRICE_HIGH_ITEM_WEIGHT = 0.7
+
+# Terms that rule an item out for a diet (simple substring heuristic)
+VEGETARIAN_EXCLUDED_TERMS = ("chicken", "beef", "lamb", "fish", "seafood", "turkey", "pork")
+VEGAN_EXCLUDED_TERMS = ("chicken", "beef", "lamb", "fish", "seafood", "cheese", "milk", "cream", "butter")
+DIET_EXCLUDED_TERMS: Dict[str, Tuple[str, ...]] = {
+    "vegetarian": VEGETARIAN_EXCLUDED_TERMS,
+    "vegan": VEGAN_EXCLUDED_TERMS,
+}
+
+
+@lru_cache(maxsize=32)
+def _excluded_terms_re(diets: FrozenSet[str]) -> Optional["re.Pattern[str]"]:
+    """Compile one alternation over every term excluded by the given diets."""
+    terms = sorted({term for diet in diets for term in DIET_EXCLUDED_TERMS.get(diet, ())})
+    if not terms:
+        return None
+    return re.compile("|".join(re.escape(term) for term in terms))
+
 
 def build_item_text(item: MenuItem) -> str:
     """
     Build searchable text representation of a menu item.
     
+    The text is computed once per item object and kept on the item.
+    
     Args:
         item: MenuItem to process
         
     Returns:
         Combined text string for embedding
     """
+    if item._search_text is not None:
+        return item._search_text
+    
     parts = [item.name]
     
     if item.ingredients:
@@ -34,7 +81,8 @@ def build_item_text(item: MenuItem) -> str:
     if item.category:
         parts.append(item.category)
     
-    return " ".join(parts).lower()
+    item._search_text = " ".join(parts).lower()
+    return item._search_text
 
 
 def embed_texts(client: OpenAI, model: str, texts: List[str]) -> np.ndarray:
@@ -58,6 +106,113 @@ def embed_texts(client: OpenAI, model: str, texts: List[str]) -> np.ndarray:
     return np.array(embeddings)
 
 
+def embed_texts_batched(
+    client: OpenAI,
+    model: str,
+    texts: List[str],
+    batch_size: int = 256,
+    max_workers: int = 5
+) -> np.ndarray:
+    """
+    Get embeddings for many texts, sending fixed-size batches concurrently.
+    
+    Args:
+        client: OpenAI client
+        model: Embedding model name
+        texts: List of texts to embed
+        batch_size: Maximum number of texts per embeddings request
+        max_workers: Maximum number of requests in flight
+        
+    Returns:
+        Numpy array of embeddings (texts x embedding_dim), in input order
+    """
+    batches = [texts[i:i + batch_size] for i in range(0, len(texts), batch_size)]
+    if len(batches) <= 1:
+        return embed_texts(client, model, texts)
+    
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(batches))) as pool:
+        results = list(pool.map(lambda batch: embed_texts(client, model, batch), batches))
+    
+    return np.vstack(results)
+
+
+def embed_query(client: OpenAI, model: str, query_text: str) -> np.ndarray:
+    """
+    Get the embedding of a single query, reusing recent results.
+    
+    Args:
+        client: OpenAI client
+        model: Embedding model name
+        query_text: Query text
+        
+    Returns:
+        Query embedding (1D array)
+    """
+    key = (model, query_text)
+    with _QUERY_EMBEDDINGS_LOCK:
+        embedding = _QUERY_EMBEDDINGS.get(key)
+        if embedding is not None:
+            _QUERY_EMBEDDINGS.move_to_end(key)
+            return embedding
+    
+    embedding = embed_texts(client, model, [query_text])[0]
+    _remember_query_embedding(model, query_text, embedding)
+    
+    return embedding
+
+
+def _remember_query_embedding(model: str, query_text: str, embedding: np.ndarray) -> None:
+    """Store a query embedding in the LRU cache used by embed_query."""
+    key = (model, query_text)
+    with _QUERY_EMBEDDINGS_LOCK:
+        _QUERY_EMBEDDINGS[key] = embedding
+        _QUERY_EMBEDDINGS.move_to_end(key)
+        if len(_QUERY_EMBEDDINGS) > QUERY_EMBEDDING_CACHE_SIZE:
+            _QUERY_EMBEDDINGS.popitem(last=False)
+
+
+def normalize_embeddings(embeddings: np.ndarray) -> np.ndarray:
+    """
+    Convert embeddings to a contiguous, L2-normalized float32 matrix.
+    
+    With rows normalized up front, cosine similarity against a normalized
+    query is a single matrix-vector product.
+    
+    Args:
+        embeddings: Embeddings array (items x embedding_dim)
+        
+    Returns:
+        Normalized float32 array of the same shape
+    """
+    matrix = np.ascontiguousarray(embeddings, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def get_menu_content_hash(menu_json: MenuJSON) -> str:
+    """
+    Get (computing once per menu object) the content hash of the menu items.
+    
+    Args:
+        menu_json: Menu data
+        
+    Returns:
+        First 16 hex digits of the SHA-256 of the serialized items
+    """
+    if menu_json._content_hash is None:
+        # Hash item by item; the bytes fed in match json.dumps of the whole item list,
+        # so existing cache filenames stay valid without building that string
+        hasher = hashlib.sha256(b"[")
+        for i, item in enumerate(menu_json.items):
+            if i:
+                hasher.update(b", ")
+            hasher.update(json.dumps(item.model_dump(), sort_keys=True).encode())
+        hasher.update(b"]")
+        menu_json._content_hash = hasher.hexdigest()[:16]
+    return menu_json._content_hash
+
+
 def get_embedding_cache_path(menu_json: MenuJSON, base_dir: str = "opt/menu_content") -> str:
     """
     Get cache file path for menu embeddings based on content hash.
@@ -69,24 +224,21 @@ def get_embedding_cache_path(menu_json: MenuJSON, base_dir: str = "opt/menu_cont
     Returns:
         Path to embedding cache file
     """
-    # Create hash of menu content
-    content_str = json.dumps(
-        [item.model_dump() for item in menu_json.items],
-        sort_keys=True
-    )
-    content_hash = hashlib.sha256(content_str.encode()).hexdigest()[:16]
+    # Hash of menu content, serialized once per menu object
+    content_hash = get_menu_content_hash(menu_json)
     
     restaurant_name = menu_json.restaurant.name or "unknown"
     safe_name = "".join(c for c in restaurant_name if c.isalnum() or c in "-_").lower()
     
-    return os.path.join(base_dir, f"{safe_name}_{content_hash}.emb.npy")
+    return os.path.join(base_dir, f"{safe_name}_{content_hash}.emb.norm.npy")
 
 
 def load_or_compute_embeddings(
     client: OpenAI,
     model_embed: str,
     menu_json: MenuJSON,
-    force_recompute: bool = False
+    force_recompute: bool = False,
+    query_texts: Optional[List[str]] = None
 ) -> np.ndarray:
     """
     Load embeddings from cache or compute them if needed.
@@ -96,103 +248,243 @@ def load_or_compute_embeddings(
         model_embed: Embedding model name
         menu_json: Menu data
         force_recompute: Force recomputation even if cache exists
+        query_texts: Queries about to be ranked; when the items have to be
+            embedded, these ride along in the same request and land in the
+            query-embedding cache
         
     Returns:
-        Item embeddings array
+        Item embeddings array, L2-normalized float32
     """
     cache_path = get_embedding_cache_path(menu_json)
+    memo_key = (model_embed, cache_path)
     
-    # Try to load from cache
-    if not force_recompute and os.path.exists(cache_path):
-        try:
-            return np.load(cache_path)
-        except Exception:
-            pass  # Fall back to recomputing
+    # Try the in-process cache, then the on-disk cache
+    if not force_recompute:
+        if memo_key in _EMBEDDING_MEMO:
+            return _EMBEDDING_MEMO[memo_key]
+        
+        if os.path.exists(cache_path):
+            try:
+                # Rows are stored L2-normalized, so loading is only a float32 upcast;
+                # memory-mapped, so that copy is the only full-size allocation
+                embeddings = np.load(cache_path, mmap_mode="r", allow_pickle=False).astype(np.float32)
+                _EMBEDDING_MEMO[memo_key] = embeddings
+                return embeddings
+            except Exception:
+                pass  # Fall back to recomputing
     
     # Compute embeddings
     texts = [build_item_text(item) for item in menu_json.items]
-    embeddings = embed_texts(client, model_embed, texts)
-    
-    # Cache the results
+    query_texts = query_texts or []
+    all_embeddings = embed_texts_batched(client, model_embed, texts + query_texts)
+    for query_text, query_embedding in zip(query_texts, all_embeddings[len(texts):]):
+        _remember_query_embedding(model_embed, query_text, query_embedding)
+    embeddings = normalize_embeddings(all_embeddings[:len(texts)])
+    _EMBEDDING_MEMO[memo_key] = embeddings
+    
+    # Cache the results (float16 on disk; normalized rows lose nothing that matters for ranking)
     try:
         os.makedirs(os.path.dirname(cache_path), exist_ok=True)
-        np.save(cache_path, embeddings)
+        np.save(cache_path, embeddings.astype(np.float16), allow_pickle=False)
     except Exception:
         pass  # Caching failed, but embeddings are computed
     
     return embeddings
 
 
+def get_ann_index(model_embed: str, menu_json: MenuJSON, embeddings: np.ndarray) -> Optional[Any]:
+    """
+    Get (building once) an HNSW cosine index over menu item embeddings.
+    
+    Args:
+        model_embed: Embedding model name
+        menu_json: Menu data
+        embeddings: Item embeddings array
+        
+    Returns:
+        hnswlib index, or None if hnswlib is unavailable or the menu is small
+    """
+    if hnswlib is None or len(embeddings) < ANN_MIN_ITEMS:
+        return None
+    
+    key = (model_embed, get_embedding_cache_path(menu_json))
+    index = _ANN_INDEXES.get(key)
+    if index is None:
+        index = hnswlib.Index(space='cosine', dim=embeddings.shape[1])
+        index.init_index(max_elements=len(embeddings), ef_construction=200, M=16)
+        index.add_items(embeddings, np.arange(len(embeddings)))
+        _ANN_INDEXES[key] = index
+    
+    return index
+
+
 def cosine_similarity(a: np.ndarray, b: np.ndarray) -> np.ndarray:
     """
     Compute cosine similarity between query and item embeddings.
     
     Args:
         a: Query embedding (1D array)
-        b: Item embeddings (2D array: items x embedding_dim)
+        b: L2-normalized item embeddings (2D array: items x embedding_dim)
         
     Returns:
         Similarity scores for each item
     """
-    # Normalize vectors
-    a_norm = a / np.linalg.norm(a)
-    b_norm = b / np.linalg.norm(b, axis=1, keepdims=True)
+    # Item rows are stored L2-normalized, so only the query norm is needed;
+    # a zero query matches nothing
+    squared_norm = float(np.dot(a, a))
+    if squared_norm <= 0:
+        return np.zeros(b.shape[0], dtype=b.dtype)
+    return (b @ a) / squared_norm ** 0.5
+
+
+class MenuFeatures:
+    """
+    Per-menu lookup data for constraint filtering and price scoring.
     
-    # Compute cosine similarity
-    return np.dot(b_norm, a_norm)
+    Built once per menu so a query reduces to NumPy boolean operations:
+    allergens are columns of an (items x allergens) indicator matrix, and
+    diet exclusions are cached as one mask per requested set of diets.
+    """
+    
+    def __init__(self, items: List[MenuItem]):
+        """
+        Precompute lookup data for the given items.
+        
+        Args:
+            items: List of menu items
+        """
+        self.texts = [
+            " ".join(
+                [k.lower() for k in item.keywords]
+                + [k.lower() for k in item.ingredients]
+                + [item.name.lower()]
+            )
+            for item in items
+        ]
+        
+        allergen_sets = [{a.lower() for a in item.allergens} for item in items]
+        self.allergen_vocab = {
+            allergen: column
+            for column, allergen in enumerate(sorted(set().union(*allergen_sets)))
+        }
+        self.allergen_matrix = np.zeros((len(items), len(self.allergen_vocab)), dtype=bool)
+        for row, allergens in enumerate(allergen_sets):
+            self.allergen_matrix[row, [self.allergen_vocab[a] for a in allergens]] = True
+        
+        # Score multipliers under a "low" price preference: expensive items are de-prioritized
+        self.low_price_weights = np.array(
+            [LOW_PRICE_HIGH_ITEM_WEIGHT if price_bucket(item.price) == "high" else 1.0 for item in items],
+            dtype=np.float32
+        )
+        self._diet_masks: Dict[FrozenSet[str], np.ndarray] = {}
+    
+    def allergen_mask(self, avoid_allergens: FrozenSet[str]) -> np.ndarray:
+        """
+        Get the items containing none of the given (lowercased) allergens.
+        
+        Args:
+            avoid_allergens: Allergens to avoid
+            
+        Returns:
+            Boolean mask over items
+        """
+        columns = [self.allergen_vocab[a] for a in avoid_allergens if a in self.allergen_vocab]
+        if not columns:
+            return np.ones(len(self.texts), dtype=bool)
+        return ~self.allergen_matrix[:, columns].any(axis=1)
+    
+    def diet_mask(self, diets: FrozenSet[str]) -> np.ndarray:
+        """
+        Get (computing once per set of diets) the items compatible with the diets.
+        
+        Args:
+            diets: Lowercased diet names
+            
+        Returns:
+            Boolean mask over items
+        """
+        mask = self._diet_masks.get(diets)
+        if mask is None:
+            excluded_re = _excluded_terms_re(diets)
+            mask = np.array(
+                [excluded_re is None or excluded_re.search(text) is None for text in self.texts],
+                dtype=bool
+            )
+            self._diet_masks[diets] = mask
+        return mask
+
+
+def get_menu_features(menu_json: MenuJSON) -> MenuFeatures:
+    """
+    Get (building once per menu object) the lookup data of a menu.
+    
+    Args:
+        menu_json: Menu data
+        
+    Returns:
+        MenuFeatures for the menu items
+    """
+    if menu_json._features is None:
+        menu_json._features = MenuFeatures(menu_json.items)
+    return menu_json._features
 
 
 def apply_constraints_filter(
     items: List[MenuItem],
-    constraints: Dict[str, Any]
-) -> List[bool]:
+    constraints: Dict[str, Any],
+    menu_features: Optional[MenuFeatures] = None
+) -> np.ndarray:
     """
     Apply constraint filters to menu items.
     
     Args:
         items: List of menu items
         constraints: Constraint dictionary
+        menu_features: Precomputed features of `items` (built here if omitted)
         
     Returns:
         Boolean mask indicating which items pass filters
     """
-    mask = [True] * len(items)
-    
-    avoid_allergens = constraints.get("avoid_allergens", [])
-    diet_requirements = constraints.get("diet", [])
-    
-    for i, item in enumerate(items):
-        # Filter out items with avoided allergens
-        if avoid_allergens:
-            item_allergens = [a.lower() for a in item.allergens]
-            if any(allergen.lower() in item_allergens for allergen in avoid_allergens):
-                mask[i] = False
-                continue
-        
-        # Apply dietary filters (basic implementation)
-        if diet_requirements:
-            item_keywords = [k.lower() for k in item.keywords]
-            item_ingredients = [k.lower() for k in item.ingredients]
-            item_text = " ".join(item_keywords + item_ingredients + [item.name.lower()])
-            
-            for diet in diet_requirements:
-                diet = diet.lower()
-                if diet == "vegetarian":
-                    # Simple heuristic: avoid obvious meat items
-                    meat_terms = ["chicken", "beef", "lamb", "fish", "seafood", "turkey", "pork"]
-                    if any(term in item_text for term in meat_terms):
-                        mask[i] = False
-                        break
-                elif diet == "vegan":
-                    # Simple heuristic: avoid meat and dairy
-                    non_vegan = ["chicken", "beef", "lamb", "fish", "seafood", "cheese", "milk", "cream", "butter"]
-                    if any(term in item_text for term in non_vegan):
-                        mask[i] = False
-                        break
+    if menu_features is None:
+        menu_features = MenuFeatures(items)
+    
+    # Filter out items with avoided allergens
+    mask = menu_features.allergen_mask(
+        frozenset(a.lower() for a in (constraints.get("avoid_allergens") or ()))
+    )
+    
+    # Dietary filters (basic implementation): any excluded term rules an item out
+    diets = frozenset(d.lower() for d in (constraints.get("diet") or ()))
+    if diets:
+        mask = mask & menu_features.diet_mask(diets)
     
     return mask
 
 
+def top_k_indices(scores: np.ndarray, top_k: int) -> np.ndarray:
+    """
+    Indices of the `top_k` largest scores, best first.
+    
+    A partial selection (argpartition) finds the top-k in linear time, and only
+    those k are then sorted.
+    
+    Args:
+        scores: 1D score array
+        top_k: Number of indices to return
+        
+    Returns:
+        Indices sorted by descending score (empty if top_k <= 0)
+    """
+    n_items = len(scores)
+    if top_k <= 0:
+        return np.empty(0, dtype=np.intp)
+    if n_items > top_k:
+        indices = np.argpartition(scores, n_items - top_k)[n_items - top_k:]
+    else:
+        indices = np.arange(n_items)
+    return indices[np.argsort(-scores[indices])]
+
+
 def rank_candidates(
     client: OpenAI,
     model_embed: str,
@@ -215,53 +507,63 @@ def rank_candidates(
     Returns:
         Ranked list of menu items
     """
-    if not menu_json.items:
+    if not menu_json.items or top_k <= 0:
         return []
     
-    # Load or compute item embeddings
-    item_embeddings = load_or_compute_embeddings(client, model_embed, menu_json)
-    
-    # Build query text from keywords and constraints
-    query_parts = query_keywords.copy()
-    
-    # Add dietary preferences to query
-    if constraints.get("diet"):
-        query_parts.extend(constraints["diet"])
-    
-    # Add price preference hint
+    # Build query text from keywords, dietary preferences and a price hint
+    query_parts = [*query_keywords, *(constraints.get("diet") or ())]
     price_pref = constraints.get("price_preference")
     if price_pref:
         query_parts.append(f"price-{price_pref}")
     
-    query_text = " ".join(query_parts)
+    query_text = " ".join(query_parts).strip()
     
-    # Get query embedding
-    if query_text.strip():
-        query_embedding = embed_texts(client, model_embed, [query_text])[0]
+    # Apply constraint filters
+    menu_features = get_menu_features(menu_json)
+    constraint_mask = apply_constraints_filter(menu_json.items, constraints, menu_features)
+    
+    if query_text:
+        # Load or compute item embeddings; a cold cache embeds the query in the same request
+        item_embeddings = load_or_compute_embeddings(
+            client, model_embed, menu_json, query_texts=[query_text]
+        )
+        query_embedding = np.asarray(embed_query(client, model_embed, query_text), dtype=np.float32)
+        
+        ann_index = get_ann_index(model_embed, menu_json, item_embeddings)
+        if ann_index is not None:
+            # Score an over-fetched shortlist so constraint filtering still leaves top_k
+            k = min(len(menu_json.items), top_k * 4)
+            ann_index.set_ef(max(k, 50))
+            labels, distances = ann_index.knn_query(query_embedding, k=k)
+            similarities = np.full(len(menu_json.items), -1.0)
+            similarities[labels[0]] = 1.0 - distances[0]
+            
+            # Restrictive constraints can reject most of the shortlist; when fewer than
+            # top_k shortlisted items survive but more qualify, score exactly instead
+            wanted = min(top_k, int(np.count_nonzero(constraint_mask)))
+            if np.count_nonzero(constraint_mask[labels[0]]) < wanted:
+                similarities = cosine_similarity(query_embedding, item_embeddings)
+        else:
+            # Item rows are pre-normalized, so cosine is a single gemv
+            similarities = cosine_similarity(query_embedding, item_embeddings)
     else:
         # If no query, use random/default ranking
         similarities = np.random.rand(len(menu_json.items))
     
-    if query_text.strip():
-        # Compute similarities
-        similarities = cosine_similarity(query_embedding, item_embeddings)
-    
-    # Apply constraint filters
-    constraint_mask = apply_constraints_filter(menu_json.items, constraints)
+    # The score vector is freshly allocated above, so the remaining steps work on it
+    # in place rather than allocating a new full-length array per step
+    final_scores = similarities
     
     # Apply price preference (de-prioritize expensive items for "low" preference)
     if price_pref == "low":
-        for i, item in enumerate(menu_json.items):
-            if item.price and price_bucket(item.price) == "high":
-                similarities[i] *= 0.7  # Reduce score for expensive items
+        final_scores *= menu_features.low_price_weights
     
     # Combine similarity scores with constraint mask
-    final_scores = np.where(constraint_mask, similarities, -1.0)
+    np.copyto(final_scores, -1.0, where=~constraint_mask)
     
-    # Get top-k indices
-    top_indices = np.argsort(final_scores)[::-1][:top_k]
+    top_indices = top_k_indices(final_scores, top_k)
     
     # Filter out items that didn't pass constraints
-    valid_indices = [i for i in top_indices if final_scores[i] >= 0]
+    valid_indices = top_indices[final_scores[top_indices] >= 0]
     
     return [menu_json.items[i] for i in valid_indices]
\ No newline at end of file
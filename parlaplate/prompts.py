@@ -87,6 +87,11 @@ EXAMPLES:
 
 CRITICAL: Always start with the JSON object exactly as shown above, never return arrays or other formats.
 
-Available menu candidates (if any): {candidates_json}
+Menu candidates, when available, are provided in a later message.
 
-Remember: Be conversational, friendly, and respect the gating rules. No menu suggestions until clear food intent is expressed."""
\ No newline at end of file
+Remember: Be conversational, friendly, and respect the gating rules. No menu suggestions until clear food intent is expressed."""
+
+# Sent after the conversation so the system prompt above stays a stable, cacheable prefix
+CANDIDATES_MESSAGE = """Available menu candidates: {candidates_json}
+
+Provide specific recommendations from the menu candidates."""
\ No newline at end of file
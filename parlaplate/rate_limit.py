@@ -0,0 +1,60 @@
+"""
+Token-bucket rate limiter shared by concurrent API callers.
+"""
+import threading
+import time
+
+
+class RateLimiter:
+    """
+    Thread-safe token bucket that spaces out requests to a per-minute budget.
+    
+    The bucket holds up to `burst` tokens and refills at `requests_per_minute / 60`
+    tokens per second. Callers block in `acquire` until a token is available, so
+    any number of worker threads together stay under the limit instead of
+    bursting into 429 responses and retrying at the same moment.
+    """
+    
+    def __init__(self, requests_per_minute: float, burst: int = 1):
+        """
+        Initialize a full bucket.
+        
+        Args:
+            requests_per_minute: Sustained request rate
+            burst: Maximum number of requests that may start back to back
+        """
+        if requests_per_minute <= 0:
+            raise ValueError("requests_per_minute must be positive")
+        
+        self.rate = requests_per_minute / 60.0
+        self.capacity = float(max(1, burst))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+    
+    def acquire(self, tokens: float = 1.0) -> None:
+        """
+        Block until `tokens` tokens are available, then take them.
+        
+        Args:
+            tokens: Number of tokens the request costs
+            
+        Raises:
+            ValueError: If `tokens` exceeds the bucket capacity and could never be granted
+        """
+        if tokens > self.capacity:
+            raise ValueError(f"Cannot acquire {tokens} tokens from a bucket of capacity {self.capacity}")
+        
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                
+                wait_seconds = (tokens - self._tokens) / self.rate
+            
+            time.sleep(wait_seconds)
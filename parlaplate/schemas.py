@@ -2,13 +2,22 @@
 Pydantic schemas for ParlaPlate application.
 """
 from datetime import datetime
-from typing import List, Literal, Optional
-import json
+from typing import Any, List, Literal, Optional
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, PrivateAttr
 
 
-class MenuItem(BaseModel):
+class _CachingModel(BaseModel):
+    """Base for models that keep lazily derived data in private attributes."""
+    
+    def __eq__(self, other: Any) -> bool:
+        # Compare fields only, so cached private data never affects equality
+        if not isinstance(other, BaseModel):
+            return NotImplemented
+        return type(self) is type(other) and self.__dict__ == other.__dict__
+
+
+class MenuItem(_CachingModel):
     """Represents a single menu item with all its properties."""
     name: str = Field(..., description="Name of the menu item")
     price: Optional[str] = Field(None, description="Price as a string (e.g., '15.99 TL')")
@@ -17,6 +26,9 @@ class MenuItem(BaseModel):
     allergens: List[str] = Field(default_factory=list, description="Known allergens")
     category: Optional[str] = Field(None, description="Menu category (appetizers, mains, etc.)")
     spice_level: Optional[Literal["low", "medium", "high"]] = Field(None, description="Spice level")
+    
+    # Search text built lazily by parlaplate.match.build_item_text (not serialized)
+    _search_text: Optional[str] = PrivateAttr(default=None)
 
 
 class RestaurantProfile(BaseModel):
@@ -31,10 +43,14 @@ class RestaurantProfile(BaseModel):
     summary_text: str = Field(..., description="25-40 word summary of the restaurant")
 
 
-class MenuJSON(BaseModel):
+class MenuJSON(_CachingModel):
     """Complete menu data structure with restaurant profile and items."""
     restaurant: RestaurantProfile = Field(..., description="Restaurant profile")
     items: List[MenuItem] = Field(..., description="List of all menu items")
+    
+    # Lookup data derived from the items, built lazily by parlaplate.match (not serialized)
+    _features: Optional[Any] = PrivateAttr(default=None)
+    _content_hash: Optional[str] = PrivateAttr(default=None)
 
 
 class OrderItem(BaseModel):
@@ -71,9 +87,5 @@ def serialize_order(order: Order) -> str:
     Returns:
         Pretty formatted JSON string
     """
-    return json.dumps(
-        order.model_dump(mode="json"),
-        indent=2,
-        ensure_ascii=False,
-        default=str
-    )
\ No newline at end of file
+    # pydantic's native serializer; same output as json.dumps over model_dump(mode="json")
+    return order.model_dump_json(indent=2)
\ No newline at end of file
@@ -0,0 +1,92 @@
+"""
+Embedding-keyed semantic cache for reusing LLM results across similar messages.
+"""
+import threading
+from typing import Any, List, Optional
+
+import numpy as np
+
+
+class SemanticCache:
+    """
+    Cache mapping message embeddings to values, matched by cosine similarity.
+    
+    Entries are stored as L2-normalized rows of a float32 matrix so a lookup is
+    a single matrix-vector product. The least recently used entry is evicted
+    once the cache is full.
+    """
+    
+    def __init__(self, threshold: float = 0.95, max_entries: int = 1000):
+        """
+        Initialize an empty cache.
+        
+        Args:
+            threshold: Minimum cosine similarity for a hit
+            max_entries: Maximum number of cached entries
+        """
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self._matrix: Optional[np.ndarray] = None
+        self._values: List[Any] = []
+        self._last_used: List[int] = []
+        self._clock = 0
+        self._lock = threading.Lock()
+    
+    def __len__(self) -> int:
+        return len(self._values)
+    
+    @staticmethod
+    def _normalize(embedding: np.ndarray) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32).ravel()
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+    
+    def get(self, embedding: np.ndarray) -> Optional[Any]:
+        """
+        Look up the value of the most similar cached embedding.
+        
+        Args:
+            embedding: Query embedding (1D array)
+        
+        Returns:
+            Cached value, or None if no entry reaches the threshold
+        """
+        query = self._normalize(embedding)
+        with self._lock:
+            if self._matrix is None:
+                return None
+            
+            scores = self._matrix @ query
+            best = int(np.argmax(scores))
+            if scores[best] < self.threshold:
+                return None
+            
+            self._clock += 1
+            self._last_used[best] = self._clock
+            return self._values[best]
+    
+    def put(self, embedding: np.ndarray, value: Any) -> None:
+        """
+        Add an entry, evicting the least recently used one if full.
+        
+        Args:
+            embedding: Message embedding (1D array)
+            value: Value to cache
+        """
+        row = self._normalize(embedding)
+        with self._lock:
+            self._clock += 1
+            
+            if self._matrix is not None and len(self._values) >= self.max_entries:
+                victim = int(np.argmin(self._last_used))
+                self._matrix[victim] = row
+                self._values[victim] = value
+                self._last_used[victim] = self._clock
+                return
+            
+            if self._matrix is None:
+                self._matrix = row[np.newaxis, :]
+            else:
+                self._matrix = np.vstack([self._matrix, row])
+            self._values.append(value)
+            self._last_used.append(self._clock)
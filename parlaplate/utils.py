@@ -6,14 +6,24 @@ import json
 import hashlib
 import re
 import base64
+import contextlib
+import threading
+from functools import lru_cache
 from io import BytesIO
 from typing import List, Optional
 from pathlib import Path
 
+import pydantic_core
 from PIL import Image
 
 from .schemas import MenuJSON
 
+# Shared decoder for locating JSON values embedded in model output
+_JSON_DECODER = json.JSONDecoder()
+
+# First numeric value in a price string
+_PRICE_NUMBER_RE = re.compile(r'\d+(?:\.\d+)?')
+
 
 def list_menu_jsons(dir_path: str = "opt/menu_content") -> List[str]:
     """
@@ -40,6 +50,9 @@ def load_menu_json(path: str) -> MenuJSON:
     """
     Load menu JSON from file.
     
+    Parsed menus are cached per (path, modification time), so repeated loads
+    of an unchanged file return the same read-only instance.
+    
     Args:
         path: Path to JSON file
         
@@ -48,32 +61,78 @@ def load_menu_json(path: str) -> MenuJSON:
         
     Raises:
         FileNotFoundError: If file doesn't exist
-        json.JSONDecodeError: If file is not valid JSON
-        ValueError: If JSON doesn't match schema
+        ValueError: If file is not valid JSON or doesn't match schema
+    """
+    return _load_menu_json_cached(path, os.path.getmtime(path))
+
+
+@lru_cache(maxsize=32)
+def _load_menu_json_cached(path: str, mtime: float) -> MenuJSON:
+    """Parse one version of a menu file; `mtime` only keys the cache."""
+    # Parse and validate in one pass with pydantic's native JSON parser
+    with open(path, 'rb') as f:
+        return MenuJSON.model_validate_json(f.read())
+
+
+def peek_restaurant_name(path: str, head_bytes: int = 2048) -> Optional[str]:
+    """
+    Read the restaurant display name from a menu JSON without parsing the items.
+    
+    Only the head of the file is scanned; falls back to a full load if the
+    restaurant block does not fit in it.
+    
+    Args:
+        path: Path to JSON file
+        head_bytes: Number of bytes to scan from the start of the file
+        
+    Returns:
+        Display name (or name) of the restaurant, None if neither is set
     """
-    with open(path, 'r', encoding='utf-8') as f:
-        data = json.load(f)
+    with open(path, 'rb') as f:
+        head = f.read(head_bytes).decode('utf-8', errors='ignore')
+    
+    items_pos = head.find('"items"')
+    if items_pos != -1:
+        restaurant_block = head[:items_pos]
+        values = {}
+        for field in ("display_name", "name"):
+            match = re.search(rf'"{field}"\s*:\s*("(?:[^"\\]|\\.)*"|null)', restaurant_block)
+            values[field] = json.loads(match.group(1)) if match else None
+        # Same rule as the full load below: an empty or null display_name falls back to name
+        return values["display_name"] or values["name"]
     
-    return MenuJSON.model_validate(data)
+    restaurant = load_menu_json(path).restaurant
+    return restaurant.display_name or restaurant.name
 
 
 def save_menu_json(menu_json: MenuJSON, path: str) -> None:
     """
     Save menu JSON to file.
     
+    The JSON is written in one call to a temporary file next to `path` and
+    renamed into place, so readers never see a partially written menu.
+    
     Args:
         menu_json: MenuJSON object to save
         path: Output file path
     """
     os.makedirs(os.path.dirname(path), exist_ok=True)
     
-    with open(path, 'w', encoding='utf-8') as f:
-        json.dump(
-            menu_json.model_dump(mode="json"),
-            f,
-            ensure_ascii=False,
-            indent=2
-        )
+    # pydantic-core writes the same UTF-8, 2-space indented JSON as model_dump_json,
+    # straight to bytes without a str round-trip
+    data = pydantic_core.to_json(menu_json, indent=2)
+    
+    # Unique per writer thread; a plain open() keeps the umask-derived permissions
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        # The temp file may never have been created (e.g. open() itself failed)
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(tmp_path)
+        raise
 
 
 def sha256_text(text: str) -> str:
@@ -89,6 +148,7 @@ def sha256_text(text: str) -> str:
     return hashlib.sha256(text.encode('utf-8')).hexdigest()
 
 
+@lru_cache(maxsize=4096)
 def price_bucket(price_str: Optional[str]) -> Optional[str]:
     """
     Categorize price string into low/medium/high buckets.
@@ -102,13 +162,13 @@ def price_bucket(price_str: Optional[str]) -> Optional[str]:
     if not price_str:
         return None
     
-    # Extract numeric value from price string
-    numbers = re.findall(r'\d+(?:\.\d+)?', price_str)
-    if not numbers:
+    # Extract the first numeric value from the price string
+    number = _PRICE_NUMBER_RE.search(price_str)
+    if not number:
         return None
     
     try:
-        price_value = float(numbers[0])
+        price_value = float(number.group(0))
         
         # Simple heuristic based on common price ranges
         # These thresholds might need adjustment based on currency and context
@@ -127,6 +187,9 @@ def pil_to_base64_png(img: Image.Image) -> str:
     """
     Convert PIL Image to base64-encoded PNG string.
     
+    Uses fast zlib compression: the image is sent straight to the API, where
+    encode time matters more than a slightly larger payload.
+    
     Args:
         img: PIL Image object
         
@@ -134,11 +197,23 @@ def pil_to_base64_png(img: Image.Image) -> str:
         Base64-encoded PNG data URL
     """
     buffer = BytesIO()
-    img.save(buffer, format="PNG")
-    buffer.seek(0)
+    img.save(buffer, format="PNG", optimize=False, compress_level=1)
     
-    img_base64 = base64.b64encode(buffer.read()).decode('utf-8')
-    return f"data:image/png;base64,{img_base64}"
+    return bytes_to_data_url(buffer.getvalue(), "image/png")
+
+
+def bytes_to_data_url(data: bytes, mime_type: str) -> str:
+    """
+    Convert encoded image bytes to a base64 data URL.
+    
+    Args:
+        data: Encoded image bytes (e.g. JPEG)
+        mime_type: MIME type of the data (e.g. "image/jpeg")
+        
+    Returns:
+        Base64-encoded data URL
+    """
+    return f"data:{mime_type};base64,{base64.b64encode(data).decode('utf-8')}"
 
 
 def clean_filename(filename: str) -> str:
@@ -163,6 +238,30 @@ def clean_filename(filename: str) -> str:
     return cleaned.lower() if cleaned else "menu"
 
 
+def _find_json_value(text: str, opener: str) -> Optional[str]:
+    """
+    Find the first valid JSON value starting with `opener` ('[' or '{').
+    
+    Each candidate start is located with str.find and decoded by the C
+    decoder, which stops at the end of the value and fails fast on prose.
+    
+    Args:
+        text: Text to search
+        opener: Opening character of the wanted JSON value
+        
+    Returns:
+        The JSON substring, or None if no candidate decodes
+    """
+    start = text.find(opener)
+    while start != -1:
+        try:
+            _, end = _JSON_DECODER.raw_decode(text, start)
+            return text[start:end]
+        except json.JSONDecodeError:
+            start = text.find(opener, start + 1)
+    return None
+
+
 def extract_json_from_response(response_text: str) -> Optional[str]:
     """
     Extract JSON from model response that might contain extra text.
@@ -176,71 +275,11 @@ def extract_json_from_response(response_text: str) -> Optional[str]:
     # Clean the response text
     response_text = response_text.strip()
     
-    # First try to find JSON arrays (for menu extraction)
-    array_start = -1
-    bracket_count = 0
-    
-    for i, char in enumerate(response_text):
-        if char == '[':
-            if array_start == -1:
-                array_start = i
-            bracket_count += 1
-        elif char == ']':
-            bracket_count -= 1
-            if bracket_count == 0 and array_start != -1:
-                # Found complete JSON array
-                json_str = response_text[array_start:i+1]
-                try:
-                    # Test if it's valid JSON
-                    json.loads(json_str)
-                    return json_str
-                except:
-                    # Reset and continue searching
-                    array_start = -1
-                    bracket_count = 0
-                    continue
-    
-    # Then try to find JSON objects
-    obj_start = -1
-    brace_count = 0
-    
-    for i, char in enumerate(response_text):
-        if char == '{':
-            if obj_start == -1:
-                obj_start = i
-            brace_count += 1
-        elif char == '}':
-            brace_count -= 1
-            if brace_count == 0 and obj_start != -1:
-                # Found complete JSON object
-                json_str = response_text[obj_start:i+1]
-                try:
-                    # Test if it's valid JSON
-                    json.loads(json_str)
-                    return json_str
-                except:
-                    # Reset and continue searching
-                    obj_start = -1
-                    brace_count = 0
-                    continue
-    
-    # Fallback to regex patterns with better matching
-    json_patterns = [
-        r'\[\s*\{.*?\}\s*\]',  # Array of objects
-        r'\[.*?\]',            # Any array
-        r'\{.*?\}',            # Any object
-    ]
-    
-    for pattern in json_patterns:
-        match = re.search(pattern, response_text, re.DOTALL)
-        if match:
-            try:
-                # Test if it's valid JSON
-                json_str = match.group(0)
-                json.loads(json_str)
-                return json_str
-            except:
-                continue
+    # First try JSON arrays (for menu extraction), then JSON objects
+    for opener in '[{':
+        json_str = _find_json_value(response_text, opener)
+        if json_str is not None:
+            return json_str
     
     return None
 
@@ -8,33 +8,41 @@ Usage:
 """
 import os
 import sys
+import hashlib
 import argparse
 import logging
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from pathlib import Path
+from typing import TYPE_CHECKING, Dict, Iterator, List, NamedTuple, Optional, Tuple
 
-# Add parent directory to path to import parlaplate
-sys.path.insert(0, str(Path(__file__).parent.parent))
+# Fall back to the repo root on sys.path when the package isn't installed (pip install -e .)
+try:
+    import parlaplate  # noqa: F401
+except ImportError:
+    sys.path.insert(0, str(Path(__file__).parent.parent))
 
-from openai import OpenAI
-from dotenv import load_dotenv
+# OpenAI, PyMuPDF and the extraction pipeline are imported lazily so --help and
+# argument errors return without loading them
+if TYPE_CHECKING:
+    from openai import OpenAI
+    from parlaplate.schemas import MenuJSON
 
-from parlaplate.extract import extract_menu_from_pdf_path
-from parlaplate.prompts import (
-    EXTRACTION_SYSTEM_PROMPT,
-    VISION_EXTRACTION_USER_PROMPT,
-    RESTAURANT_SUMMARY_SYSTEM
-)
-
-# Set up logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s'
-)
 logger = logging.getLogger(__name__)
 
+# Concurrent Vision calls per PDF
+PAGE_WORKERS = 8
+
+# Seconds an idle pooled connection stays open, long enough to bridge PDFs in a batch
+KEEPALIVE_EXPIRY = 120.0
+
+# Extraction results are cached under {output_dir}/.cache/, keyed by PDF content hash
+EXTRACTION_CACHE_DIR = ".cache"
+
 
 def load_config():
     """Load configuration from environment or .env file."""
+    from dotenv import load_dotenv
+    
     load_dotenv()
     
     config = {
@@ -50,21 +58,148 @@ def load_config():
     return config
 
 
+def iter_pdf_files(directory: str = "opt/menu") -> Iterator[str]:
+    """
+    Yield PDF file paths in directory as the scan reaches them.
+    
+    Paths come in directory order, not sorted.
+    
+    Args:
+        directory: Directory to scan
+        
+    Raises:
+        FileNotFoundError: If the directory doesn't exist
+    """
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if entry.name[-4:].lower() == '.pdf' and entry.is_file():
+                yield entry.path
+
+
 def find_pdf_files(directory: str = "opt/menu") -> list:
     """Find all PDF files in directory."""
-    if not os.path.exists(directory):
+    try:
+        return sorted(iter_pdf_files(directory))
+    except FileNotFoundError:
         logger.warning(f"Directory {directory} does not exist")
         return []
+
+
+class ExtractionResult(NamedTuple):
+    """Outcome of processing one PDF, handed back to main() for reporting."""
+    pdf_path: str
+    menu_json: Optional["MenuJSON"] = None
+    output_path: Optional[str] = None
+    error: Optional[str] = None
+    
+    @property
+    def success(self) -> bool:
+        return self.error is None
+    
+    def summary_line(self) -> str:
+        """One-line report of the extracted menu, or of the failure."""
+        if not self.success:
+            return f"   ❌ {self.pdf_path}: {self.error}"
+        
+        restaurant = self.menu_json.restaurant
+        categories = {item.category for item in self.menu_json.items}
+        categories.discard(None)
+        categories.discard("")
+        return (
+            f"   ✅ {restaurant.display_name or restaurant.name or 'Unknown'}: "
+            f"{len(self.menu_json.items)} items, {len(categories)} categories, "
+            f"price level {restaurant.price_level or 'unknown'} -> {self.output_path}"
+        )
+
+
+def group_identical_pdfs(
+    pdf_files: List[str]
+) -> Tuple[List[str], Dict[str, List[str]], Dict[str, Tuple[bytes, str]], Dict[str, int]]:
+    """
+    Group PDF files with identical bytes so each distinct PDF is extracted once.
+    
+    Only files that share their size with another file can be copies, so only
+    those are read and hashed here. Their bytes and SHA256 are handed back for
+    process_pdf_file, so no file is read or hashed twice.
+    
+    Args:
+        pdf_files: Paths of the PDFs to process
+        
+    Returns:
+        Tuple of (first path of each distinct PDF, dict of first path -> paths of
+        its copies, dict of path -> (bytes, hex digest) for the files read here,
+        dict of path -> size in bytes for the files that could be stat'ed)
+    """
+    size_by_file = {}
+    files_by_size = {}
+    for pdf_file in pdf_files:
+        try:
+            size = os.path.getsize(pdf_file)
+            size_by_file[pdf_file] = size
+        except OSError:
+            # Leave unreadable files to process_pdf_file, which reports the error
+            size = pdf_file
+        files_by_size.setdefault(size, []).append(pdf_file)
+    
+    unique_files = []
+    copies = {}
+    loaded = {}
+    first_by_hash = {}
+    for pdf_file in pdf_files:
+        if len(files_by_size[size_by_file.get(pdf_file, pdf_file)]) == 1:
+            unique_files.append(pdf_file)
+            continue
+        
+        try:
+            pdf_bytes = Path(pdf_file).read_bytes()
+        except OSError:
+            unique_files.append(pdf_file)
+            continue
+        
+        pdf_hash = hashlib.sha256(pdf_bytes).hexdigest()
+        first_file = first_by_hash.setdefault(pdf_hash, pdf_file)
+        if first_file == pdf_file:
+            unique_files.append(pdf_file)
+            loaded[pdf_file] = (pdf_bytes, pdf_hash)
+        else:
+            copies.setdefault(first_file, []).append(pdf_file)
+    
+    return unique_files, copies, loaded, size_by_file
+
+
+def save_copy_result(result: ExtractionResult, pdf_path: str, output_dir: str) -> ExtractionResult:
+    """
+    Write the menu extracted for one PDF under the name of an identical copy.
+    
+    Args:
+        result: Result of the PDF that was actually extracted
+        pdf_path: Path of the identical copy
+        output_dir: Output directory for JSON files
+        
+    Returns:
+        ExtractionResult for the copy
+    """
+    from parlaplate.utils import clean_filename, save_menu_json
     
-    pdf_files = []
-    for filename in os.listdir(directory):
-        if filename.lower().endswith('.pdf'):
-            pdf_files.append(os.path.join(directory, filename))
+    if not result.success:
+        return ExtractionResult(pdf_path, error=result.error)
     
-    return sorted(pdf_files)
+    try:
+        output_path = os.path.join(output_dir, f"{clean_filename(Path(pdf_path).name)}.json")
+        save_menu_json(result.menu_json, output_path)
+        return ExtractionResult(pdf_path, result.menu_json, output_path)
+    except Exception as e:
+        logger.error(f"❌ Error saving {pdf_path}: {e}")
+        return ExtractionResult(pdf_path, error=str(e) or type(e).__name__)
 
 
-def process_pdf_file(pdf_path: str, client: OpenAI, config: dict) -> bool:
+def process_pdf_file(
+    pdf_path: str,
+    client: "OpenAI",
+    config: dict,
+    pdf_bytes: Optional[bytes] = None,
+    pdf_hash: Optional[str] = None
+) -> ExtractionResult:
     """
     Process a single PDF file.
     
@@ -72,37 +207,66 @@ def process_pdf_file(pdf_path: str, client: OpenAI, config: dict) -> bool:
         pdf_path: Path to PDF file
         client: OpenAI client
         config: Configuration dict
+        pdf_bytes: Contents of the file if already read (read here otherwise)
+        pdf_hash: SHA256 hex digest of pdf_bytes if already computed
         
     Returns:
-        True if successful, False otherwise
+        ExtractionResult with the menu and its output path, or the error
     """
+    from parlaplate.extract import extract_menu_from_pdf_bytes
+    from parlaplate.prompts import (
+        EXTRACTION_SYSTEM_PROMPT,
+        VISION_EXTRACTION_USER_PROMPT,
+        RESTAURANT_SUMMARY_SYSTEM
+    )
+    from parlaplate.schemas import MenuJSON
+    from parlaplate.utils import clean_filename, save_menu_json
+    
     try:
-        logger.info(f"Processing: {pdf_path}")
+        logger.debug(f"Processing: {pdf_path}")
         
-        # Extract menu
-        menu_json, output_path = extract_menu_from_pdf_path(
-            pdf_path=pdf_path,
-            client=client,
-            model_vision=config['model_vision'],
-            model_chat=config['model_chat'],
-            extraction_system=EXTRACTION_SYSTEM_PROMPT,
-            extraction_user=VISION_EXTRACTION_USER_PROMPT,
-            summary_system=RESTAURANT_SUMMARY_SYSTEM
-        )
+        # Read the PDF once; the same buffer feeds the cache key and the extraction
+        if pdf_bytes is None:
+            pdf_bytes = Path(pdf_path).read_bytes()
+        pdf_name = Path(pdf_path).name
+        
+        # Unchanged PDFs are served from the extraction cache without any API calls
+        if pdf_hash is None:
+            pdf_hash = hashlib.sha256(pdf_bytes).hexdigest()
+        cache_path = Path(config['output_dir']) / EXTRACTION_CACHE_DIR / f"{pdf_hash}.json"
         
-        # Print stats
-        restaurant_name = menu_json.restaurant.display_name or menu_json.restaurant.name or "Unknown"
-        logger.info(f"✅ Extracted menu for: {restaurant_name}")
-        logger.info(f"   📄 Total items: {len(menu_json.items)}")
-        logger.info(f"   🏷️  Categories: {len(set(item.category for item in menu_json.items if item.category))}")
-        logger.info(f"   💰 Price level: {menu_json.restaurant.price_level or 'unknown'}")
-        logger.info(f"   📁 Saved to: {output_path}")
+        if cache_path.exists() and not config.get('force'):
+            logger.debug(f"Cache hit for {pdf_path} ({pdf_hash[:12]})")
+            menu_json = MenuJSON.model_validate_json(cache_path.read_bytes())
+            output_path = os.path.join(config['output_dir'], f"{clean_filename(pdf_name)}.json")
+            save_menu_json(menu_json, output_path)
+        else:
+            # Extract menu
+            menu_json, output_path = extract_menu_from_pdf_bytes(
+                pdf_bytes=pdf_bytes,
+                pdf_name=pdf_name,
+                client=client,
+                model_vision=config['model_vision'],
+                model_chat=config['model_chat'],
+                extraction_system=EXTRACTION_SYSTEM_PROMPT,
+                extraction_user=VISION_EXTRACTION_USER_PROMPT,
+                summary_system=RESTAURANT_SUMMARY_SYSTEM,
+                max_workers=PAGE_WORKERS,
+                rate_limiter=config.get('rate_limiter'),
+                output_dir=config['output_dir']
+            )
+            save_menu_json(menu_json, str(cache_path))
+        
+        result = ExtractionResult(pdf_path, menu_json, output_path)
+        # summary_line() walks every item, so skip it unless DEBUG is on
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"Extracted {pdf_path}:\n{result.summary_line()}")
         
-        return True
+        return result
         
     except Exception as e:
         logger.error(f"❌ Error processing {pdf_path}: {e}")
-        return False
+        return ExtractionResult(pdf_path, error=str(e) or type(e).__name__)
 
 
 def main():
@@ -115,6 +279,9 @@ Examples:
   python -m tasks.menu_extract                      # Process all PDFs in opt/menu/
   python -m tasks.menu_extract --file menu.pdf     # Process specific file
   python -m tasks.menu_extract --input-dir custom/ # Process PDFs in custom directory
+  python -m tasks.menu_extract --jobs 8            # Process up to 8 PDFs at once
+  python -m tasks.menu_extract --jobs 16 --rpm 500 # Stay under 500 requests/minute
+  python -m tasks.menu_extract --force             # Ignore cached extractions
         """
     )
     
@@ -135,6 +302,26 @@ Examples:
         help='Output directory for JSON files (default: opt/menu_content)'
     )
     
+    parser.add_argument(
+        '--jobs', '-j',
+        type=int,
+        default=int(os.getenv('MENU_CONCURRENCY', '4')),
+        help='Number of PDF files processed concurrently (default: $MENU_CONCURRENCY or 4)'
+    )
+    
+    parser.add_argument(
+        '--rpm',
+        type=float,
+        default=float(os.getenv('MENU_RPM', '0')),
+        help='Cap on OpenAI requests per minute across all workers, 0 for no cap (default: $MENU_RPM or 0)'
+    )
+    
+    parser.add_argument(
+        '--force',
+        action='store_true',
+        help='Ignore cached extractions and re-run the Vision pipeline'
+    )
+    
     parser.add_argument(
         '--verbose', '-v',
         action='store_true',
@@ -143,17 +330,16 @@ Examples:
     
     args = parser.parse_args()
     
-    if args.verbose:
-        logging.getLogger().setLevel(logging.DEBUG)
+    # Set up logging before the parlaplate modules are imported, so this format wins
+    logging.basicConfig(
+        level=logging.DEBUG if args.verbose else logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s'
+    )
     
     # Load configuration
     config = load_config()
-    
-    # Create OpenAI client
-    client = OpenAI(api_key=config['openai_api_key'])
-    
-    # Create output directory
-    os.makedirs(args.output_dir, exist_ok=True)
+    config['output_dir'] = args.output_dir
+    config['force'] = args.force
     
     # Determine files to process
     if args.file:
@@ -171,25 +357,78 @@ Examples:
     
     logger.info(f"Found {len(pdf_files)} PDF file(s) to process")
     
-    # Process files
-    successful = 0
-    failed = 0
+    # Identical PDFs (the same menu saved twice) are extracted once; each copy
+    # gets the extracted menu written under its own name
+    unique_files, copies, loaded, size_by_file = group_identical_pdfs(pdf_files)
+    for first_file, copy_files in copies.items():
+        logger.info(f"{', '.join(copy_files)} identical to {first_file}, extracting once")
     
-    for pdf_file in pdf_files:
-        if process_pdf_file(pdf_file, client, config):
-            successful += 1
-        else:
-            failed += 1
-        
-        # Add a separator between files
-        if len(pdf_files) > 1:
-            logger.info("-" * 50)
-    
-    # Final summary
-    logger.info(f"📊 Processing complete:")
-    logger.info(f"   ✅ Successful: {successful}")
-    logger.info(f"   ❌ Failed: {failed}")
-    logger.info(f"   📁 Output directory: {args.output_dir}")
+    import httpx
+    from openai import DefaultHttpxClient, OpenAI
+    
+    # Create OpenAI client (the SDK retries 429s with exponential backoff). Its pool
+    # keeps a warm connection for every call that can be in flight, so TLS handshakes
+    # are paid once per connection rather than per request.
+    queue_depth = max(1, min(args.jobs, len(unique_files)))
+    pool_size = queue_depth * PAGE_WORKERS
+    http_client = DefaultHttpxClient(
+        limits=httpx.Limits(
+            max_connections=pool_size,
+            max_keepalive_connections=pool_size,
+            keepalive_expiry=KEEPALIVE_EXPIRY
+        )
+    )
+    client = OpenAI(api_key=config['openai_api_key'], max_retries=5, http_client=http_client)
+    
+    # One token bucket shared by every worker keeps the whole batch under the
+    # account's rate limit, so raising --jobs doesn't turn into a 429 retry storm
+    if args.rpm > 0:
+        from parlaplate.rate_limit import RateLimiter
+        config['rate_limiter'] = RateLimiter(args.rpm, burst=PAGE_WORKERS)
+    
+    # Create output directory
+    os.makedirs(args.output_dir, exist_ok=True)
+    
+    # Keep at most `queue_depth` files in flight and tally each one as it finishes;
+    # every file is bound by OpenAI round-trips, not CPU
+    results = {}
+    
+    with ThreadPoolExecutor(max_workers=queue_depth) as executor:
+        # Largest PDFs (most pages, most Vision calls) start first so a big file
+        # doesn't begin last and run alone while the other workers sit idle
+        queued = iter(sorted(unique_files, key=lambda pdf_file: size_by_file.get(pdf_file, 0), reverse=True))
+        pending = set()
+        futures_by_file = {}
+        while True:
+            for pdf_file in queued:
+                # pop() so a preloaded buffer is freed once its file is done
+                future = executor.submit(
+                    process_pdf_file, pdf_file, client, config, *loaded.pop(pdf_file, ())
+                )
+                futures_by_file[future] = pdf_file
+                pending.add(future)
+                if len(pending) >= queue_depth:
+                    break
+            if not pending:
+                break
+            
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                pdf_file = futures_by_file.pop(future)
+                results[pdf_file] = future.result()
+                for copy_file in copies.get(pdf_file, ()):
+                    results[copy_file] = save_copy_result(results[pdf_file], copy_file, args.output_dir)
+            if len(pdf_files) > 1:
+                logger.info(f"Progress: {len(results)}/{len(pdf_files)} file(s) done")
+    
+    # Final summary: one record with a line per file, in input order
+    failed = sum(1 for result in results.values() if not result.success)
+    lines = ["📊 Processing complete:"]
+    lines.extend(results[pdf_file].summary_line() for pdf_file in pdf_files)
+    lines.append(f"   ✅ Successful: {len(results) - failed}")
+    lines.append(f"   ❌ Failed: {failed}")
+    lines.append(f"   📁 Output directory: {args.output_dir}")
+    logger.info("\n".join(lines))
     
     if failed > 0:
         sys.exit(1)